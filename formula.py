@@ -1,139 +1,415 @@
+import argparse
+import gzip
 import os
-import json
 import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    import orjson as _json
+except ImportError:
+    # orjson is optional; the standard library parser also accepts bytes
+    import json as _json
+
+try:
+    import ijson
+except ImportError:
+    # ijson is optional; without it large replays are parsed in one go
+    ijson = None
+
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional; without it the vectorized NumPy aggregation is used
+    njit = None
+
+
+# Troop types share one integer code space: the scored troops first, in the
+# order analyze_replay reports them, then the tower. Codes >= UNTRACKED can be
+# attacked but are never credited with performance.
+TROOP_IDX = {"giant": 0, "knight": 1, "goblin": 2, "archer": 3, "tower": 4}
+UNTRACKED = 4
+TRACKED_TROOPS = ("giant", "knight", "goblin", "archer")
+COST_LUT = np.array([5, 3, 2, 3, 10], dtype=np.float64)
+HP_LUT = np.array([1200, 600, 150, 250, 2000], dtype=np.float64)
+
+# Column order returned by _load_replay (after the spawned codes) and stored
+# in the Parquet attacks table
+ATTACK_COLUMNS = ("attacker_code", "target_target_code", "target_code", "team_code", "damage")
+
+# Replays at least this large are stream-parsed with ijson when it is installed
+# (gzipped replays are compared by their compressed size)
+STREAM_THRESHOLD = 64 * 1024 * 1024
+
+# Replay files analyzed in a folder; .json.gz files are gzip-compressed JSON
+REPLAY_EXTENSIONS = ('.json', '.json.gz')
+
+# First bytes of a gzip file, as checked by ReplayLoader.load
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Per-file results of previous folder runs, keyed by path, mtime and size
+CACHE_PATH = os.path.join("analysis_results", "replay_cache.json")
+
+
+def _troop_codes(troop_ids, troop_codes, ids):
+    """Look up the troop code of each id in sorted troop_ids, -1 if it is not a troop."""
+    if len(troop_ids) == 0:
+        return np.full(len(ids), -1, dtype=np.int8)
+    pos = np.minimum(np.searchsorted(troop_ids, ids), len(troop_ids) - 1)
+    return np.where(troop_ids[pos] == ids, troop_codes[pos], -1).astype(np.int8)
+
+
+def _parse_target_type(target_type, parsed_target_types):
+    """Split a target_type string into (target code, team code), caching each string."""
+    parsed = parsed_target_types.get(target_type)
+    if parsed is None:
+        # Parse target type; team code 0 marks attacks that are not on a player unit
+        if "_" in target_type:
+            target, team = target_type.split("_")
+            parsed = (TROOP_IDX.get(target.lower(), -1), 1 if team.lower() == "player" else 0)
+        else:
+            parsed = (-1, 0)
+        parsed_target_types[target_type] = parsed
+    return parsed
+
+
+def _spawned_codes(troops_spawned):
+    """Return spawned troop codes plus troop IDs and codes sorted by ID."""
+    # Map troop IDs to troop type codes. IDs are CPython object addresses, far
+    # too sparse for a dense table, so keep them sorted for binary search.
+    troopid_to_code = {}
+    for troop in troops_spawned:
+        troop_type = troop["troop_type"].lower()
+        troopid_to_code[troop["troop_id"]] = TROOP_IDX.get(troop_type, UNTRACKED)
+    spawned = np.fromiter(troopid_to_code.values(), dtype=np.int64, count=len(troopid_to_code))
+    troop_ids = np.fromiter(troopid_to_code.keys(), dtype=np.int64, count=len(troopid_to_code))
+    order = np.argsort(troop_ids)
+    return spawned, troop_ids[order], spawned[order]
+
+
+def _attack_columns(attacks):
+    """Build attacker ID, target-target ID, target code, team code and damage columns."""
+    n = len(attacks)
+    attacker_id = np.fromiter((attack["attacker_id"] for attack in attacks), dtype=np.int64, count=n)
+    target_target_id = np.fromiter((attack.get("target_target_id") or 0 for attack in attacks),
+                                   dtype=np.int64, count=n)
+    damage = np.fromiter((attack["damage"] for attack in attacks), dtype=np.float64, count=n)
+    
+    # Each distinct target_type string is split and looked up only once
+    target_code = np.empty(n, dtype=np.int8)
+    team_code = np.empty(n, dtype=np.int8)
+    parsed_target_types = {}
+    for i, attack in enumerate(attacks):
+        target_code[i], team_code[i] = _parse_target_type(attack["target_type"], parsed_target_types)
+    
+    return attacker_id, target_target_id, target_code, team_code, damage
+
+
+def _attack_columns_stream(attacks):
+    """Like _attack_columns, but fills growable buffers from an attack iterator."""
+    size = 1024
+    attacker_id = np.empty(size, dtype=np.int64)
+    target_target_id = np.empty(size, dtype=np.int64)
+    target_code = np.empty(size, dtype=np.int8)
+    team_code = np.empty(size, dtype=np.int8)
+    damage = np.empty(size, dtype=np.float64)
+    
+    parsed_target_types = {}
+    n = 0
+    for attack in attacks:
+        if n == size:
+            # Double the buffers when they are full
+            size *= 2
+            attacker_id = np.resize(attacker_id, size)
+            target_target_id = np.resize(target_target_id, size)
+            target_code = np.resize(target_code, size)
+            team_code = np.resize(team_code, size)
+            damage = np.resize(damage, size)
+        attacker_id[n] = attack["attacker_id"]
+        target_target_id[n] = attack.get("target_target_id") or 0
+        damage[n] = attack["damage"]
+        target_code[n], team_code[n] = _parse_target_type(attack["target_type"], parsed_target_types)
+        n += 1
+    
+    return attacker_id[:n], target_target_id[:n], target_code[:n], team_code[:n], damage[:n]
+
+
+def _open_replay(replay_path):
+    """Open a replay file for binary reading, decompressing it if it is gzipped."""
+    with open(replay_path, 'rb') as file:
+        compressed = file.read(2) == GZIP_MAGIC
+    if compressed:
+        return gzip.open(replay_path, 'rb')
+    return open(replay_path, 'rb')
+
+
+def _load_replay(replay_path):
+    """
+    Load a replay file into flat arrays for the aggregation kernel.
+    
+    Args:
+        replay_path: Path to the replay JSON file (optionally gzipped)
+        
+    Returns:
+        Tuple of (spawned troop codes, attacker codes, target-target codes,
+        target codes, team codes, damage)
+    """
+    with _open_replay(replay_path) as file:
+        if ijson is not None and os.path.getsize(replay_path) >= STREAM_THRESHOLD:
+            # Large replays are streamed so the full JSON tree is never built
+            spawned, troop_ids, troop_codes = _spawned_codes(
+                ijson.items(file, "troops_spawned.item", use_float=True))
+            file.seek(0)
+            columns = _attack_columns_stream(ijson.items(file, "attacks.item", use_float=True))
+        else:
+            data = _json.loads(file.read())
+            spawned, troop_ids, troop_codes = _spawned_codes(data["troops_spawned"])
+            columns = _attack_columns(data["attacks"])
+    attacker_id, target_target_id, target_code, team_code, damage = columns
+    
+    attacker_code = _troop_codes(troop_ids, troop_codes, attacker_id)
+    target_target_code = _troop_codes(troop_ids, troop_codes, target_target_id)
+    # A missing target_target_id never refers to a troop
+    target_target_code[target_target_id == 0] = -1
+    
+    return spawned, attacker_code, target_target_code, target_code, team_code, damage
+
+
+def _aggregate_numpy(attacker_code, target_target_code, target_code, team_code, damage,
+                     cost_lut, max_hp_lut, perf):
+    """Add attack contributions to perf using vectorized masks."""
+    tracked = perf.shape[0]
+    on_player = (team_code == 1) & (target_code >= 0)
+    by_troop = attacker_code >= 0
+    direct = on_player & by_troop & (attacker_code < tracked)
+    assisted = on_player & ~by_troop & (target_target_code >= 0) & (target_target_code < tracked)
+    
+    safe_target = np.where(on_player, target_code, 0)
+    value = (damage / max_hp_lut[safe_target]) * cost_lut[safe_target]
+    # One np.add.at in attack order, so the float sums match _aggregate_loop exactly
+    credited = direct | assisted
+    np.add.at(perf, np.where(direct, attacker_code, target_target_code)[credited],
+              np.where(direct, value * 1.5, value)[credited])
+
+
+def _aggregate_loop(attacker_code, target_target_code, target_code, team_code, damage,
+                    cost_lut, max_hp_lut, perf):
+    """Add attack contributions to perf one attack at a time (compiled with numba)."""
+    tracked = perf.shape[0]
+    for i in range(attacker_code.shape[0]):
+        target = target_code[i]
+        if team_code[i] != 1 or target < 0:
+            continue
+        
+        attacker = attacker_code[i]
+        if attacker >= 0:
+            if attacker < tracked:
+                perf[attacker] += (damage[i] / max_hp_lut[target]) * cost_lut[target] * 1.5
+        else:
+            target_target = target_target_code[i]
+            if 0 <= target_target < tracked:
+                perf[target_target] += (damage[i] / max_hp_lut[target]) * cost_lut[target]
+
+
+if njit is not None:
+    _aggregate = njit(cache=True, boundscheck=False, error_model="numpy")(_aggregate_loop)
+else:
+    _aggregate = _aggregate_numpy
+
+
+def _summarize(counts, perf):
+    """Average accumulated performance per troop type, rounded for display."""
+    troop_performance = dict.fromkeys(TRACKED_TROOPS, 0)
+    
+    for code, troop_type in enumerate(TRACKED_TROOPS):
+        if counts[code] > 0:
+            # Round for display
+            troop_performance[troop_type] = round(float(perf[code] / counts[code]), 2)
+    
+    return troop_performance
 
 
 def analyze_replay(replay_path):
     """Analyze a single replay file and return troop performance metrics"""
-    troop_costs = {"knight": 3, "giant": 5, "goblin": 2, "archer": 3, "tower": 10}
-    troop_max_hp = {"knight": 600, "giant": 1200, "goblin": 150, "archer": 250, "tower": 2000}
-    
-    troop_performance = {
-        "giant": 0,
-        "knight": 0,
-        "goblin": 0,
-        "archer": 0
-    }
-    
-    troop_count = {
-        "giant": 0,
-        "knight": 0,
-        "goblin": 0,
-        "archer": 0
-    }
-    
     try:
-        with open(replay_path, 'r') as file:
-            data = json.load(file)
-            
-            # Map troop IDs to troop types
-            troopid_to_troop = {}
-            for troop in data["troops_spawned"]:
-                troop_id_str = str(troop["troop_id"])
-                troop_type = troop["troop_type"].lower()
-                troopid_to_troop[troop_id_str] = troop_type
-            
-            # Calculate initial costs
-            for troop_id in troopid_to_troop:
-                troop_type = troopid_to_troop[troop_id]
-                if troop_type in troop_count:
-                    troop_count[troop_type] += 1
-                    troop_performance[troop_type] -= troop_costs[troop_type]
-            
-            # Calculate performance based on attacks
-            for attack in data["attacks"]:
-                # Parse target type
-                if "_" in attack["target_type"]:
-                    target, team = attack["target_type"].split("_")
-                    target = target.lower()
-                    team = team.lower()
-                    
-                    # Convert IDs to strings for comparison
-                    attacker_id_str = str(attack["attacker_id"])
-                    target_target_id_str = str(attack.get("target_target_id", "")) if attack.get("target_target_id") else ""
-                    
-                    # Evaluate attack effectiveness
-                    if team == "player" and attacker_id_str in troopid_to_troop:
-                        troop_type = troopid_to_troop[attacker_id_str]
-                        if troop_type in troop_performance and target in troop_max_hp:
-                            troop_performance[troop_type] += (attack["damage"] / troop_max_hp[target]) * troop_costs[target] * 1.5
-                    
-                    elif team == "player" and target_target_id_str in troopid_to_troop:
-                        troop_type = troopid_to_troop[target_target_id_str]
-                        if troop_type in troop_performance and target in troop_max_hp:
-                            troop_performance[troop_type] += (attack["damage"] / troop_max_hp[target]) * troop_costs[target] * 1
-
-        # Calculate average performance per troop type
-        for troop_type in troop_performance:
-            if troop_count[troop_type] > 0:
-                troop_performance[troop_type] /= troop_count[troop_type]
-                # Round for display
-                troop_performance[troop_type] = round(troop_performance[troop_type], 2)
-            else:
-                troop_performance[troop_type] = 0
-                
-        return troop_performance
+        spawned, *columns = _load_replay(replay_path)
+        
+        # Calculate initial costs
+        counts = np.bincount(spawned, minlength=UNTRACKED + 1)[:UNTRACKED]
+        perf = -(counts * COST_LUT[:UNTRACKED])
+        
+        # Evaluate attack effectiveness: troops damaging a player unit earn
+        # 1.5x, troops that were being targeted by the damaged unit earn 1x
+        _aggregate(*columns, COST_LUT, HP_LUT, perf)
+        
+        return _summarize(counts, perf)
         
     except Exception as e:
         print(f"Error analyzing replay {replay_path}: {str(e)}")
         return {}
 
 
+def analyze_parquet(dataset_path):
+    """
+    Analyze every replay in a Parquet dataset written by replays_to_parquet.py.
+    
+    Args:
+        dataset_path: Directory containing replays, spawns and attacks tables
+        
+    Returns:
+        List of troop performance dictionaries, one per replay
+    """
+    import pyarrow.parquet as pq
+    
+    replay_ids = pq.read_table(os.path.join(dataset_path, "replays.parquet"),
+                               columns=["replay_id"]).column("replay_id").to_numpy()
+    spawns = pq.read_table(os.path.join(dataset_path, "spawns.parquet"))
+    attacks = pq.read_table(os.path.join(dataset_path, "attacks.parquet"))
+    
+    # Spawn counts for every replay at once
+    counts = np.zeros((len(replay_ids), UNTRACKED + 1), dtype=np.int64)
+    np.add.at(counts, (spawns.column("replay_id").to_numpy(), spawns.column("troop_code").to_numpy()), 1)
+    counts = counts[:, :UNTRACKED]
+    
+    # Attack rows are stored grouped by replay, so each replay is a slice
+    attack_replay = attacks.column("replay_id").to_numpy()
+    columns = [attacks.column(name).to_numpy() for name in ATTACK_COLUMNS]
+    starts = np.searchsorted(attack_replay, replay_ids, side="left")
+    ends = np.searchsorted(attack_replay, replay_ids, side="right")
+    
+    results = []
+    for replay_id, start, end in zip(replay_ids, starts, ends):
+        perf = -(counts[replay_id] * COST_LUT[:UNTRACKED])
+        _aggregate(*(column[start:end] for column in columns), COST_LUT, HP_LUT, perf)
+        results.append(_summarize(counts[replay_id], perf))
+    
+    return results
+
+
+def _load_cache(cache_path=CACHE_PATH):
+    """Load cached replay results, or an empty cache if there is none."""
+    try:
+        with open(cache_path, 'rb') as file:
+            return _json.loads(file.read())
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache, cache_path=CACHE_PATH):
+    """Write cached replay results to disk."""
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    # Same serializer as _load_cache; orjson returns bytes, the standard library a str
+    data = _json.dumps(cache)
+    if isinstance(data, str):
+        data = data.encode()
+    with open(cache_path, 'wb') as file:
+        file.write(data)
+
+
+def analyze_replays_cached(replays, cache_path=CACHE_PATH):
+    """
+    Analyze replay files, reusing results for files that have not changed.
+    
+    Args:
+        replays: List of replay file paths
+        cache_path: JSON file holding results of previous runs
+        
+    Returns:
+        List of troop performance dictionaries, in the order of replays
+    """
+    cache = _load_cache(cache_path)
+    
+    # A file is re-analyzed only if its mtime or size changed
+    keys = {}
+    stale = []
+    for replay_path in replays:
+        st = os.stat(replay_path)
+        keys[replay_path] = [st.st_mtime_ns, st.st_size]
+        entry = cache.get(replay_path)
+        if entry is None or entry["key"] != keys[replay_path]:
+            stale.append(replay_path)
+    
+    results = {}
+    if stale:
+        # Replays are independent, so analyze them on all CPU cores
+        with ProcessPoolExecutor() as executor:
+            for replay_path, result in zip(stale, executor.map(analyze_replay, stale, chunksize=8)):
+                results[replay_path] = result
+                # A replay that failed to parse ({}) is not cached, so it is retried next run
+                if result:
+                    cache[replay_path] = {"key": keys[replay_path], "result": result}
+        _save_cache(cache, cache_path)
+    
+    return [results[replay_path] if replay_path in results else cache[replay_path]["result"]
+            for replay_path in replays]
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Analyze troop performance in replays")
+    parser.add_argument("path", nargs="?",
+                        help="Replay JSON file or Parquet dataset directory (default: replays folder)")
+    parser.add_argument("--tips", action="store_true",
+                        help="Load the fine-tuned model and print tips for countering the best troop")
+    args = parser.parse_args()
+    
     # Check if a specific replay file is provided as argument
-    if len(sys.argv) > 1 and os.path.exists(sys.argv[1]):
-        replay_path = sys.argv[1]
+    if args.path and os.path.isfile(args.path):
+        replay_path = args.path
         troop_performance = analyze_replay(replay_path)
         print("Troop Performance:")
         for troop_type, performance in troop_performance.items():
             print(f"{troop_type}: {performance:.2f}")
         return
     
-    # Otherwise analyze all replays in the folder
-    folder_path = "replays"
-    replays = []
+    if args.path and os.path.isdir(args.path):
+        # A directory argument is a Parquet dataset written by replays_to_parquet.py
+        results = analyze_parquet(args.path)
+    else:
+        # Otherwise analyze all replays in the folder
+        folder_path = "replays"
+        replays = []
 
-    # Check if the directory exists
-    if not os.path.exists(folder_path):
-        print(f"Error: {folder_path} directory does not exist")
-        return
-        
-    # Iterate through all files in the replays folder
-    for filename in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, filename)
+        # Check if the directory exists
+        if not os.path.exists(folder_path):
+            print(f"Error: {folder_path} directory does not exist")
+            return
+            
+        # Iterate through all files in the replays folder
+        for filename in os.listdir(folder_path):
+            file_path = os.path.join(folder_path, filename)
+            
+            # Check if it's a file (not a directory) and has a .json or .json.gz extension
+            if os.path.isfile(file_path) and filename.lower().endswith(REPLAY_EXTENSIONS):
+                replays.append(file_path)
         
-        # Check if it's a file (not a directory) and has .json extension
-        if os.path.isfile(file_path) and filename.lower().endswith('.json'):
-            replays.append(file_path)
+        results = analyze_replays_cached(replays)
     
     # Process all replays
-    all_performance = {
-        "giant": 0,
-        "knight": 0,
-        "goblin": 0,
-        "archer": 0
-    }
-    
-    for replay in replays:
-        troop_performance = analyze_replay(replay)
+    all_performance = dict.fromkeys(TRACKED_TROOPS, 0)
+    
+    for troop_performance in results:
         for troop_type, performance in troop_performance.items():
             all_performance[troop_type] += performance
     
     # Average across all replays
-    if replays:
+    if results:
         for troop_type in all_performance:
-            all_performance[troop_type] /= len(replays)
-    best_troop = max(all_performance.items(), key=lambda x: x[1])[0]
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    sys.path.append(os.path.abspath(os.path.join(project_root)))
-    from use import generate_response, load_fine_tuned_model  # Correct import syntax
-    model, tokenizer = load_fine_tuned_model()
-    prompt = f"Tips for countering {best_troop.capitalize()}: in Clash Royale"
-    tips = generate_response(model, tokenizer, prompt)
+            all_performance[troop_type] /= len(results)
     print("Average Troop Performance:")
     for troop_type, performance in all_performance.items():
         print(f"{troop_type}: {performance:.2f}")
-    print(f"Tips for countering {best_troop.capitalize()}: {tips}")
+    
+    # The fine-tuned model is large, so only load it when tips are requested
+    if args.tips:
+        best_troop = max(all_performance.items(), key=lambda x: x[1])[0]
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        sys.path.append(os.path.abspath(os.path.join(project_root)))
+        from use import generate_response, load_fine_tuned_model  # Correct import syntax
+        model, tokenizer = load_fine_tuned_model()
+        prompt = f"Tips for countering {best_troop.capitalize()}: in Clash Royale"
+        tips = generate_response(model, tokenizer, prompt)
+        print(f"Tips for countering {best_troop.capitalize()}: {tips}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,12 +1,14 @@
 import json
-from datasets import load_dataset
+import os
+from datasets import load_dataset, load_from_disk
 from transformers import AutoTokenizer, AutoModelForCausalLM, TrainingArguments, Trainer
 from transformers import BitsAndBytesConfig  # Import for quantization config
 from transformers import DataCollatorForLanguageModeling  # Import data collator
 from peft import LoraConfig, get_peft_model, TaskType, prepare_model_for_kbit_training
 import torch
 import gc
-import numpy as np
+import hashlib
+import importlib.util
 
 # Force garbage collection to free memory
 gc.collect()
@@ -19,20 +21,25 @@ print("CUDA version:", torch.version.cuda)
 model_name = "mistralai/Mistral-7B-v0.3"
 data_path = "clash_royale_mistral_training_20250517_175154.jsonl"
 output_dir = "./mistral-finetuned"
+tokenized_cache_dir = "./tokenized_cache"  # Tokenized datasets, memory-mapped on later runs
+PROMPT_FORMAT_VERSION = 1  # Bump after changing format_conversation or tokenize_function
 
 # === Memory-optimized settings ===
 MAX_LENGTH = 1024  # Reduce from 1024 to save memory
 GRADIENT_ACCUMULATION_STEPS = 16  # Increase from 16 to save memory (effectively smaller batch size)
 
+# === Attention and precision ===
+# FlashAttention-2 needs the flash-attn package; fall back to PyTorch SDPA without it
+ATTN_IMPLEMENTATION = "flash_attention_2" if importlib.util.find_spec("flash_attn") else "sdpa"
+# bf16 on Ampere or newer, fp16 on older GPUs
+USE_BF16 = torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+COMPUTE_DTYPE = torch.bfloat16 if USE_BF16 else torch.float16
+
 # === Load Tokenizer ===
 tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
 if tokenizer.pad_token is None:
     tokenizer.pad_token = tokenizer.eos_token  # Make sure padding is handled
 
-# === Load Dataset ===
-dataset = load_dataset("json", data_files=data_path, split="train")
-print(f"Dataset size: {len(dataset)}")
-
 # === Format messages into prompt-style strings ===
 def format_conversation(example):
     messages = example["messages"]
@@ -46,39 +53,60 @@ def format_conversation(example):
             prompt += f"<|assistant|>: {content}\n"
     return {"text": prompt.strip()}
 
-formatted_dataset = dataset.map(format_conversation)
-
 # === Tokenize for Causal LM ===
-def tokenize_function(example):
-    # Process a single example at a time to avoid collation issues
+def tokenize_function(examples):
+    # Tokenize a whole batch per call; the fast tokenizer encodes it in parallel.
+    # No padding here: the collator pads each batch to its longest sequence
     tokenized_inputs = tokenizer(
-        example["text"],
+        examples["text"],
         truncation=True,
         max_length=MAX_LENGTH,  # Use shorter sequences
-        padding="max_length",
         return_tensors=None
     )
     
-    # Convert to numpy to avoid dict error
+    # Labels are built from input_ids by the collator (with pads masked out)
     return {
-        "input_ids": np.array(tokenized_inputs["input_ids"]),
-        "attention_mask": np.array(tokenized_inputs["attention_mask"]),
-        "labels": np.array(tokenized_inputs["input_ids"])
+        "input_ids": tokenized_inputs["input_ids"],
+        "attention_mask": tokenized_inputs["attention_mask"]
     }
 
-# Process examples one at a time
-tokenized_dataset = formatted_dataset.map(
-    tokenize_function,
-    remove_columns=["text"],
-    desc="Tokenizing dataset"
-)
+# === Load Dataset ===
+# Reuse the tokenized dataset saved by a previous run with the same tokenizer (model),
+# MAX_LENGTH, prompt format and data file; any change gets its own cache directory
+data_stat = os.stat(data_path)
+cache_key = hashlib.sha1(repr((model_name, MAX_LENGTH, PROMPT_FORMAT_VERSION,
+                               data_stat.st_mtime_ns, data_stat.st_size)).encode()).hexdigest()[:16]
+tokenized_cache_path = os.path.join(tokenized_cache_dir, cache_key)
+# Written only after save_to_disk succeeds, so a half-written cache is never loaded
+cache_marker = tokenized_cache_path + ".complete"
+if os.path.exists(cache_marker):
+    tokenized_dataset = load_from_disk(tokenized_cache_path)
+    print(f"Loaded tokenized dataset from {tokenized_cache_path}")
+else:
+    dataset = load_dataset("json", data_files=data_path, split="train")
+    
+    formatted_dataset = dataset.map(format_conversation)
+    
+    # Process examples in batches across all CPU cores
+    tokenized_dataset = formatted_dataset.map(
+        tokenize_function,
+        batched=True,
+        batch_size=1000,
+        num_proc=os.cpu_count(),
+        remove_columns=["text"],
+        desc="Tokenizing dataset"
+    )
+    tokenized_dataset.save_to_disk(tokenized_cache_path)
+    with open(cache_marker, "w"):
+        pass
+print(f"Dataset size: {len(tokenized_dataset)}")
 
 # === Load Model with LoRA ===
 # More memory-efficient BitsAndBytesConfig
 quantization_config = BitsAndBytesConfig(
     load_in_4bit=True,  # Use 4-bit instead of 8-bit to save more memory
     bnb_4bit_quant_type="nf4",
-    bnb_4bit_compute_dtype=torch.float16,
+    bnb_4bit_compute_dtype=COMPUTE_DTYPE,
     bnb_4bit_use_double_quant=True
 )
 
@@ -87,12 +115,13 @@ gc.collect()
 torch.cuda.empty_cache()
 
 try:
-    print("Loading model...")
+    print(f"Loading model ({ATTN_IMPLEMENTATION}, {COMPUTE_DTYPE})...")
     model = AutoModelForCausalLM.from_pretrained(
         model_name,
         device_map="auto",
         quantization_config=quantization_config,
-        torch_dtype=torch.float16,  # Use mixed precision
+        torch_dtype=COMPUTE_DTYPE,  # Use mixed precision
+        attn_implementation=ATTN_IMPLEMENTATION,
     )
     
     # Prepare the model for k-bit training
@@ -119,7 +148,8 @@ except Exception as e:
 # === Create a data collator ===
 data_collator = DataCollatorForLanguageModeling(
     tokenizer=tokenizer,
-    mlm=False
+    mlm=False,
+    pad_to_multiple_of=8  # Dynamic padding, rounded up for tensor cores
 )
 
 # === Training Config with Memory Optimizations ===
@@ -132,16 +162,18 @@ training_args = TrainingArguments(
     logging_steps=10,
     save_strategy="steps",
     save_steps=100,
-    fp16=True,
+    fp16=not USE_BF16,
+    bf16=USE_BF16,
     report_to="none",
     logging_dir="./logs",
     overwrite_output_dir=True,
     label_names=["labels"],
     # Memory optimizations
     gradient_checkpointing=True,  # Use gradient checkpointing to save memory
-    optim="adamw_torch_fused",  # Use more memory-efficient optimizer
+    optim="paged_adamw_8bit",  # 8-bit optimizer state, paged to CPU under memory pressure
     max_grad_norm=0.3,  # Lower max gradient norm for stability
-    warmup_ratio=0.01  # Add warmup
+    warmup_ratio=0.01,  # Add warmup
+    group_by_length=True  # Batch similar-length samples to minimize padding
 )
 
 # === Trainer ===
@@ -23,6 +23,7 @@ output_file = f"clash_royale_mistral_training_{timestamp}.jsonl"
 
 subreddit = reddit.subreddit("ClashRoyale")
 limit = 1000  # Total posts to process
+flush_every = 50  # Conversations written between flushes
 
 # Define the flairs you want to search for
 target_flairs = ["Strategy", "Discussion", "Deck"]
@@ -30,30 +31,34 @@ target_flairs = ["Strategy", "Discussion", "Deck"]
 print(f"Starting search for posts with {target_flairs} flairs in r/ClashRoyale...")
 print(f"Results will be saved to {output_file}")
 
-# Process comments recursively and add them to the messages list
+# Walk a comment tree depth-first and add the comments to the messages list.
+# An explicit stack keeps deep threads clear of the recursion limit.
 def process_comments(comment, messages, indent_level=0):
-    if comment.body == "[deleted]" or not comment.author:
-        return
-    
-    # Add comment to messages
-    author_name = comment.author.name if comment.author else "Unknown"
-    
-    messages.append({
-        "role": "user" if indent_level % 2 == 0 else "assistant",
-        "content": comment.body
-    })
-    
-    # Process replies in order
-    for reply in comment.replies:
-        process_comments(reply, messages, indent_level + 1)
+    stack = [(comment, indent_level)]
+    while stack:
+        comment, indent_level = stack.pop()
+        
+        # Deleted comments are skipped along with their replies
+        if comment.body == "[deleted]" or not comment.author:
+            continue
+        
+        messages.append({
+            "role": "user" if indent_level % 2 == 0 else "assistant",
+            "content": comment.body
+        })
+        
+        # Push replies in reverse so they are processed in order
+        stack.extend((reply, indent_level + 1) for reply in reversed(list(comment.replies)))
 
-# Open file for writing
-with open(output_file, 'w', encoding='utf-8') as out_file:
+# Open file for writing; leaving the with block, also through Ctrl+C
+# (KeyboardInterrupt), closes the file and writes out the buffered conversations
+with open(output_file, 'w', encoding='utf-8', buffering=1 << 20) as out_file:
     # Get new posts
     hot = subreddit.new(limit=None)
 
     # Process posts
     n = 0
+    written = 0
     for post in hot:
         if post.link_flair_text in target_flairs:
             n += 1
@@ -95,7 +100,9 @@ with open(output_file, 'w', encoding='utf-8') as out_file:
                 }
                 
                 out_file.write(json.dumps(conversation) + "\n")
-                out_file.flush()  # Save progress
+                written += 1
+                if written % flush_every == 0:
+                    out_file.flush()  # Save progress
                 
             except Exception as e:
                 print(f"Error processing post {post.id}: {str(e)}")
@@ -0,0 +1,80 @@
+"""
+Convert the JSON replays (.json or .json.gz) in a folder into a Parquet dataset for formula.py.
+
+The dataset is a directory with three tables:
+  replays.parquet - replay_id, filename
+  spawns.parquet  - replay_id, troop_code (one row per spawned troop)
+  attacks.parquet - replay_id plus the columns in formula.ATTACK_COLUMNS
+
+Troop IDs are resolved to troop type codes during conversion, so analysis
+only has to read small integer and float columns.
+
+Usage:
+    python replays_to_parquet.py [replays_folder] [output_dir]
+    python formula.py replays.parquet
+"""
+import os
+import sys
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from formula import ATTACK_COLUMNS, REPLAY_EXTENSIONS, _load_replay
+
+SPAWN_SCHEMA = pa.schema([("replay_id", pa.int32()), ("troop_code", pa.int8())])
+ATTACK_SCHEMA = pa.schema([("replay_id", pa.int32())] + [
+    (name, pa.float64() if name == "damage" else pa.int8()) for name in ATTACK_COLUMNS
+])
+
+
+def convert_replays(folder_path="replays", output_path="replays.parquet"):
+    """
+    Stream every JSON replay (.json or .json.gz) in folder_path into the Parquet dataset.
+    
+    Args:
+        folder_path: Folder containing the JSON replays
+        output_path: Directory to write the dataset to
+        
+    Returns:
+        Number of replays written
+    """
+    os.makedirs(output_path, exist_ok=True)
+    filenames = sorted(f for f in os.listdir(folder_path)
+                       if f.lower().endswith(REPLAY_EXTENSIONS) and os.path.isfile(os.path.join(folder_path, f)))
+    
+    spawn_writer = pq.ParquetWriter(os.path.join(output_path, "spawns.parquet"), SPAWN_SCHEMA, compression="zstd")
+    attack_writer = pq.ParquetWriter(os.path.join(output_path, "attacks.parquet"), ATTACK_SCHEMA, compression="zstd")
+    
+    # Each replay becomes one row group, written in replay_id order
+    with spawn_writer, attack_writer:
+        for replay_id, filename in enumerate(filenames):
+            try:
+                spawned, *columns = _load_replay(os.path.join(folder_path, filename))
+            except Exception as e:
+                # Keep the replay in the index so averages match formula.py
+                print(f"Error converting replay {filename}: {str(e)}")
+                continue
+            
+            spawn_writer.write_table(pa.table({
+                "replay_id": np.full(len(spawned), replay_id, dtype=np.int32),
+                "troop_code": spawned.astype(np.int8),
+            }, schema=SPAWN_SCHEMA))
+            
+            attack_table = {"replay_id": np.full(len(columns[0]), replay_id, dtype=np.int32)}
+            attack_table.update(zip(ATTACK_COLUMNS, columns))
+            attack_writer.write_table(pa.table(attack_table, schema=ATTACK_SCHEMA))
+    
+    pq.write_table(pa.table({
+        "replay_id": np.arange(len(filenames), dtype=np.int32),
+        "filename": filenames,
+    }), os.path.join(output_path, "replays.parquet"))
+    
+    return len(filenames)
+
+
+if __name__ == "__main__":
+    folder_path = sys.argv[1] if len(sys.argv) > 1 else "replays"
+    output_path = sys.argv[2] if len(sys.argv) > 2 else "replays.parquet"
+    count = convert_replays(folder_path, output_path)
+    print(f"Converted {count} replays to {output_path}")
@@ -1,10 +1,17 @@
+# Small integer id for every card name, so cards can be compared by name cheaply
+_NAME_IDS = {}
+
+
 class Card:
     """
     Represents a character card with attributes and behavior.
     """
     
+    __slots__ = ('name', 'name_id', 'attack', 'hp', 'cost', 'range', 'original_hp')
+    
     def __init__(self, name, attack, hp, cost, range=1):
         self.name = name
+        self.name_id = _NAME_IDS.setdefault(name, len(_NAME_IDS))  # Same id for the same name
         self.attack = attack
         self.hp = hp
         self.cost = cost
@@ -30,6 +37,48 @@ class Card:
         return f"Card({self.name}, {self.attack}, {self.hp}, {self.cost}, {self.range})"
 
 
+class CardRegistry:
+    """
+    Interns card stats as templates indexed by a small integer card id.
+    
+    Units on the field only keep a card id and their current HP; name, cost,
+    attack, range and starting HP are read from the templates.
+    """
+    
+    def __init__(self):
+        self.names = []
+        self.attack = []
+        self.hp = []
+        self.cost = []
+        self.range = []
+        self._ids = {}  # (name, attack, hp, cost, range) -> card id
+    
+    def register(self, card):
+        """Return the card id for the card's stats, adding a template if needed."""
+        key = (card.name, card.attack, card.hp, card.cost, card.range)
+        card_id = self._ids.get(key)
+        if card_id is None:
+            card_id = len(self.names)
+            self._ids[key] = card_id
+            self.names.append(card.name)
+            self.attack.append(card.attack)
+            self.hp.append(card.hp)
+            self.cost.append(card.cost)
+            self.range.append(card.range)
+        return card_id
+    
+    def make_card(self, card_id, hp=None):
+        """Build a Card from a template, optionally with a different current HP."""
+        card = Card(self.names[card_id], self.attack[card_id], self.hp[card_id],
+                    self.cost[card_id], self.range[card_id])
+        if hp is not None:
+            card.hp = hp
+        return card
+    
+    def __len__(self):
+        return len(self.names)
+
+
 class CardDeck:
     """
     Manages a collection of cards for a player.
@@ -1,35 +1,354 @@
 import random
-from .card import Card  # Import Card class for state restoration
+import numpy as np
+from .card import Card, CardRegistry  # Import Card class for state restoration
+
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional; without it the turn kernels run as plain Python
+    njit = None
+
+# Grid cell values: unit ids are >= 1, towers use negative sentinels
+EMPTY = 0
+TOWER1 = -1  # Player 1's tower
+TOWER2 = -2  # Player 2's tower
+# Labels used for the towers in replay states
+TOWER_LABELS = {TOWER1: 'T1', TOWER2: 'T2'}
+
+# Attack kinds returned by the target selection kernel
+NO_ATTACK = 0
+UNIT_ATTACK = 1
+TOWER_ATTACK = 2
+
+# Initial number of unit slots; the unit arrays double when they fill up
+INITIAL_UNIT_CAPACITY = 64
+
+# One record per unit in the array snapshots from _get_state_array
+UNIT_STATE_DTYPE = np.dtype([
+    ('id', np.int32),  # Unit ids are never reused, so they outgrow int16 in long games
+    ('position', np.int16),
+    ('hp', np.int16),
+    ('attack', np.int16),
+    ('range', np.int8),
+    ('owner', np.int8),
+    ('moved', np.bool_),
+    ('card', np.int16),  # Card id in GameEnvironment.cards
+])
+
+
+def _step_into_gaps_loop(grid, unit_pos, unit_owner, unit_hp, unit_alive, moved, start):
+    """
+    Step units into 1-cell gaps between opposing units, from grid[start] on.
+    
+    The unit with more HP moves into the gap if it faces that way. On an HP
+    tie nothing is moved and the gap position is returned so the caller can
+    flip the coin; -1 is returned once the whole grid has been scanned.
+    """
+    grid_size = grid.shape[0]
+    empty_pos = max(start, 1)
+    while empty_pos < grid_size - 1:
+        left_pos = empty_pos - 1
+        right_pos = empty_pos + 1
+        left_cell = grid[left_pos]
+        right_cell = grid[right_pos]
+        
+        # Skip unless the cell is a gap between two live units of different owners
+        if (grid[empty_pos] != EMPTY or left_cell <= EMPTY or right_cell <= EMPTY
+                or not unit_alive[left_cell] or not unit_alive[right_cell]
+                or unit_owner[left_cell] == unit_owner[right_cell]):
+            empty_pos += 1
+            continue
+        
+        left_hp = unit_hp[left_cell]
+        right_hp = unit_hp[right_cell]
+        if left_hp > right_hp:
+            # Move left unit (if it's Player 1)
+            if unit_owner[left_cell] == 1:
+                grid[left_pos] = EMPTY
+                grid[empty_pos] = left_cell
+                unit_pos[left_cell] = empty_pos
+                moved[left_cell] = True
+        elif right_hp > left_hp:
+            # Move right unit (if it's Player 2)
+            if unit_owner[right_cell] == 2:
+                grid[right_pos] = EMPTY
+                grid[empty_pos] = right_cell
+                unit_pos[right_cell] = empty_pos
+                moved[right_cell] = True
+        else:
+            return empty_pos
+        
+        # The right neighbour was a unit, so it is never a gap of its own
+        # (even when that unit just stepped out of it)
+        empty_pos += 2
+    return -1
+
+
+def _move_units_loop(grid, unit_pos, unit_owner, unit_range, ids, moved):
+    """
+    Move units one cell towards the enemy tower, furthest from it first.
+    
+    Ranged units stay put while an enemy unit or the enemy tower is in range.
+    Units that move are flagged in moved.
+    """
+    grid_size = grid.shape[0]
+    
+    # Player 1 units by descending position, then Player 2 units by ascending
+    # position: one argsort over keys that put every Player 1 unit first
+    keys = np.empty(ids.shape[0], dtype=np.int64)
+    for i in range(ids.shape[0]):
+        position = unit_pos[ids[i]]
+        keys[i] = -position if unit_owner[ids[i]] == 1 else grid_size + position
+    order = ids[np.argsort(keys)]
+    
+    for unit_id in order:
+        position = unit_pos[unit_id]
+        owner = unit_owner[unit_id]
+        attack_range = unit_range[unit_id]
+        
+        # For ranged units (range > 1), check if there are enemies in range
+        if attack_range > 1:
+            has_targets = False
+            # Check for enemy units in range
+            for target_id in ids:
+                if unit_owner[target_id] != owner:
+                    if abs(unit_pos[target_id] - position) <= attack_range:
+                        has_targets = True
+                        break
+            
+            # Check for enemy tower in range
+            if not has_targets:
+                if owner == 1 and position + attack_range >= grid_size - 1:
+                    has_targets = True
+                elif owner == 2 and position - attack_range <= 0:
+                    has_targets = True
+            
+            if has_targets:
+                continue
+        
+        direction = 1 if owner == 1 else -1
+        new_position = position + direction
+        
+        # Check if movement is possible
+        if 0 <= new_position < grid_size and grid[new_position] == EMPTY:
+            grid[position] = EMPTY
+            grid[new_position] = unit_id
+            unit_pos[unit_id] = new_position
+            moved[unit_id] = True
+
+
+def _select_targets_loop(unit_pos, unit_owner, unit_range, ids, moved, grid_size, kinds, targets):
+    """
+    Pick the target of every unit in ids that did not move this turn.
+    
+    The closest enemy unit within range is attacked (ties go to the lowest id);
+    without one, the enemy tower is attacked if it is in range. kinds receives
+    NO_ATTACK, UNIT_ATTACK or TOWER_ATTACK and targets the unit id or tower owner.
+    """
+    for i in range(ids.shape[0]):
+        unit_id = ids[i]
+        kinds[i] = NO_ATTACK
+        targets[i] = 0
+        if moved[unit_id]:
+            continue
+        
+        position = unit_pos[unit_id]
+        owner = unit_owner[unit_id]
+        attack_range = unit_range[unit_id]
+        
+        # Find the closest enemy unit within range
+        best_distance = -1
+        for target_id in ids:
+            if unit_owner[target_id] == owner:
+                continue
+            distance = abs(unit_pos[target_id] - position)
+            if distance <= attack_range and (best_distance < 0 or distance < best_distance):
+                best_distance = distance
+                targets[i] = target_id
+        
+        if best_distance >= 0:
+            kinds[i] = UNIT_ATTACK
+        elif owner == 1 and position + attack_range >= grid_size - 1:
+            # Player 1's unit can attack Player 2's tower
+            kinds[i] = TOWER_ATTACK
+            targets[i] = 2
+        elif owner == 2 and position - attack_range <= 0:
+            # Player 2's unit can attack Player 1's tower
+            kinds[i] = TOWER_ATTACK
+            targets[i] = 1
+
+
+def _apply_attacks_loop(grid, unit_pos, unit_hp, unit_attack, unit_alive, ids, kinds, targets):
+    """
+    Resolve the attacks picked by _select_targets, one unit after another in ids order.
+    
+    A unit destroyed earlier in the phase no longer attacks. Destroyed units
+    are cleared from the grid and flagged dead. Returns the winner (0 while
+    both towers stand) and the number of units destroyed.
+    """
+    winner = 0
+    destroyed = 0
+    for i in range(ids.shape[0]):
+        unit_id = ids[i]
+        if kinds[i] == NO_ATTACK or not unit_alive[unit_id]:
+            continue
+        
+        if kinds[i] == TOWER_ATTACK:
+            # The tower is destroyed and its owner loses
+            winner = 3 - targets[i]
+            continue
+        
+        defender_id = targets[i]
+        if not unit_alive[defender_id]:
+            continue
+        
+        # Apply damage and remove the defender if it is destroyed
+        unit_hp[defender_id] -= unit_attack[unit_id]
+        if unit_hp[defender_id] <= 0:
+            grid[unit_pos[defender_id]] = EMPTY
+            unit_alive[defender_id] = False
+            destroyed += 1
+    return winner, destroyed
+
+
+def _tick_loop(grid, unit_pos, unit_owner, unit_hp, unit_range, unit_alive, unit_moved, ids, start):
+    """
+    Run the movement phase: stalemate gaps from grid[start] on, then regular movement.
+    
+    Returns the gap position of a stalemate HP tie, leaving movement for the
+    call that resumes after the coin flip, or -1 once every unit has moved.
+    """
+    empty_pos = _step_into_gaps(grid, unit_pos, unit_owner, unit_hp, unit_alive, unit_moved, start)
+    if empty_pos >= 0:
+        return empty_pos
+    
+    _move_units(grid, unit_pos, unit_owner, unit_range, ids, unit_moved)
+    return -1
+
+
+# The on-disk cache records this module's name, so every entry point must import
+# it as game.environment (with src on sys.path), never as src.game.environment
+if njit is not None:
+    _move_units = njit(cache=True)(_move_units_loop)
+    _step_into_gaps = njit(cache=True)(_step_into_gaps_loop)
+    _select_targets = njit(cache=True)(_select_targets_loop)
+    _apply_attacks = njit(cache=True)(_apply_attacks_loop)
+    _tick = njit(cache=True)(_tick_loop)
+else:
+    _move_units = _move_units_loop
+    _step_into_gaps = _step_into_gaps_loop
+    _select_targets = _select_targets_loop
+    _apply_attacks = _apply_attacks_loop
+    _tick = _tick_loop
+
 
 class GameEnvironment:
     """
     Manages the game grid, towers, and core game mechanics.
+    
+    Units are stored as parallel arrays indexed by unit id (unit_pos,
+    unit_owner, unit_hp, unit_attack, unit_range, unit_alive, unit_moved);
+    the units property builds the dict view used by players and visualizers.
     """
     
-    def __init__(self, grid_size=18):
+    __slots__ = ('grid_size', 'rng', 'grid', 'turn_count', 'game_over', 'winner', 'cards',
+                 'next_unit_id', 'current_attacks', 'unit_pos', 'unit_owner', 'unit_hp',
+                 'unit_attack', 'unit_range', 'unit_alive', 'unit_card', 'unit_moved', '_ids',
+                 'unit_counts')
+    
+    def __init__(self, grid_size=18, rng=None):
         # Initialize the grid with zeros (empty spaces)
         self.grid_size = grid_size
-        self.grid = [0] * grid_size
+        # Random generator for stalemate tie-breaks (the global random state by default)
+        self.rng = rng if rng is not None else random
+        # Cells hold unit ids, which keep growing for the whole game, so int16 could wrap
+        self.grid = np.zeros(grid_size, dtype=np.int32)
         
         # Place towers at each end
-        self.grid[0] = 'T1'  # Player 1's tower
-        self.grid[-1] = 'T2'  # Player 2's tower
+        self.grid[0] = TOWER1  # Player 1's tower
+        self.grid[-1] = TOWER2  # Player 2's tower
         
         # Game state
         self.turn_count = 0
         self.game_over = False
         self.winner = None
         
-        # Units on the field (id: {position, card_instance, owner})
-        self.units = {}
-        self.next_unit_id = 1
+        # Card stats shared by all units of the same card
+        self.cards = CardRegistry()
         
-        # Track units that moved this turn (can't attack after moving)
-        self.moved_units = set()
+        # Units on the field, one array slot per unit id (slot 0 is unused)
+        self._allocate_units(INITIAL_UNIT_CAPACITY)
+        self.next_unit_id = 1
         
         # Track attacks for this turn
         self.current_attacks = []
     
+    def _allocate_units(self, capacity):
+        """Create empty unit arrays with room for capacity - 1 units."""
+        self.unit_pos = np.zeros(capacity, dtype=np.int16)
+        self.unit_owner = np.zeros(capacity, dtype=np.int8)
+        # Card stats are small ints; HP is signed since damage can take it below zero
+        self.unit_hp = np.zeros(capacity, dtype=np.int16)
+        self.unit_attack = np.zeros(capacity, dtype=np.int16)
+        self.unit_range = np.zeros(capacity, dtype=np.int8)
+        self.unit_alive = np.zeros(capacity, dtype=np.bool_)
+        self.unit_card = np.zeros(capacity, dtype=np.int16)  # Card id in self.cards
+        self.unit_moved = np.zeros(capacity, dtype=np.bool_)  # Moved this turn (can't attack after moving)
+        self._ids = None  # Cached ids of the units on the field
+        self.unit_counts = [0, 0, 0]  # Units on the field per player id (index 0 is unused)
+    
+    def _grow_units(self):
+        """Double the capacity of the unit arrays."""
+        capacity = 2 * len(self.unit_alive)
+        for name in ('unit_pos', 'unit_owner', 'unit_hp', 'unit_attack', 'unit_range', 'unit_alive', 'unit_card', 'unit_moved'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+    
+    def _add_unit(self, unit_id, card_id, hp, position, player_id):
+        """Store a unit in the unit arrays and on the grid."""
+        while unit_id >= len(self.unit_alive):
+            self._grow_units()
+        
+        self.unit_pos[unit_id] = position
+        self.unit_owner[unit_id] = player_id
+        self.unit_hp[unit_id] = hp
+        self.unit_attack[unit_id] = self.cards.attack[card_id]
+        self.unit_range[unit_id] = self.cards.range[card_id]
+        self.unit_alive[unit_id] = True
+        self.unit_card[unit_id] = card_id
+        self._ids = None
+        self.unit_counts[player_id] += 1
+        
+        self.grid[position] = unit_id
+    
+    def _unit_ids(self):
+        """Ids of the units on the field, in ascending order."""
+        if self._ids is None:
+            self._ids = np.flatnonzero(self.unit_alive)
+        return self._ids
+    
+    @property
+    def units(self):
+        """
+        Units on the field as {id: {position, card, owner}}, in ascending id order.
+        
+        The cards are read-only views built from the card templates.
+        """
+        units = {}
+        for unit_id in self._unit_ids().tolist():
+            units[unit_id] = {
+                'position': int(self.unit_pos[unit_id]),
+                'card': self.cards.make_card(int(self.unit_card[unit_id]), int(self.unit_hp[unit_id])),
+                'owner': int(self.unit_owner[unit_id])
+            }
+        return units
+    
+    def count_units(self, player_id):
+        """Return the number of units a player has on the field."""
+        return self.unit_counts[player_id]
+    
     def place_card(self, card, position, player_id):
         """Place a card on the grid."""
         if not self._is_valid_placement(position, player_id):
@@ -39,38 +358,40 @@ class GameEnvironment:
         unit_id = self.next_unit_id
         self.next_unit_id += 1
         
-        self.units[unit_id] = {
-            'position': position,
-            'card': card.copy(),  # Create a copy of the card
-            'owner': player_id
-        }
-        
-        self.grid[position] = unit_id
+        # Units share the card's template instead of holding a copy of the card
+        card_id = self.cards.register(card)
+        self._add_unit(unit_id, card_id, self.cards.hp[card_id], position, player_id)
         
         # Mark the newly spawned unit as moved (can't attack on first turn)
-        self.moved_units.add(unit_id)
+        self.unit_moved[unit_id] = True
         
         return unit_id
     
+    def spawn_positions(self, player_id):
+        """Return the cells where a player may place units (1 or 2 blocks from their tower)."""
+        if player_id == 1:
+            return (1, 2)
+        return (self.grid_size-2, self.grid_size-3)
+    
     def _is_valid_placement(self, position, player_id):
         """Check if a position is valid for placement."""
         # Check if position is within bounds and not occupied
         if position < 0 or position >= self.grid_size:
             return False
         
-        if self.grid[position] != 0:
+        if self.grid[position] != EMPTY:
             return False
         
         # NEW RULE: Units can only be placed 1 or 2 blocks from their tower
         if player_id == 1:
             # Player 1's tower is at position 0
             # Valid positions are 1 and 2
-            if position not in [1, 2]:
+            if position != 1 and position != 2:
                 return False
         else:  # player_id == 2
             # Player 2's tower is at position grid_size-1
             # Valid positions are grid_size-2 and grid_size-3
-            if position not in [self.grid_size-2, self.grid_size-3]:
+            if position != self.grid_size-2 and position != self.grid_size-3:
                 return False
         
         return True
@@ -80,247 +401,90 @@ class GameEnvironment:
         # Increment turn counter at the start of movement phase
         self.turn_count += 1
         
-        # Reset the moved units set at the beginning of each turn
-        self.moved_units = set()
-        
-        # Check for stalemate situation (1-cell gap between opposing units)
-        self._resolve_stalemates()
-        
-        # Sort units by their distance from the enemy tower
-        # Player 1 units are sorted by descending position (furthest from enemy tower first)
-        # Player 2 units are sorted by ascending position (furthest from enemy tower first)
-        player1_units = [(unit_id, data) for unit_id, data in self.units.items() if data['owner'] == 1]
-        player1_units.sort(key=lambda x: x[1]['position'], reverse=True)  # Furthest from enemy tower first
-        
-        player2_units = [(unit_id, data) for unit_id, data in self.units.items() if data['owner'] == 2]
-        player2_units.sort(key=lambda x: x[1]['position'])  # Furthest from enemy tower first
-        
-        # Combine sorted units
-        units_to_move = player1_units + player2_units
+        # Reset the moved flags at the beginning of each turn
+        self.unit_moved.fill(False)
         
-        for unit_id, unit_data in units_to_move:
-            # Skip if unit was destroyed during this turn
-            if unit_id not in self.units:
-                continue
-            
-            position = unit_data['position']
-            owner = unit_data['owner']
-            card = unit_data['card']
-            
-            # For ranged units (range > 1), check if there are enemies in range
-            if card.range > 1:
-                has_targets = False
-                # Check for enemy units in range
-                for target_id, target_data in self.units.items():
-                    if target_data['owner'] != owner:  # Enemy unit
-                        target_pos = target_data['position']
-                        distance = abs(target_pos - position)
-                        if distance <= card.range:
-                            has_targets = True
-                            break
-                
-                # Check for enemy tower in range
-                if not has_targets:
-                    if owner == 1 and position + card.range >= self.grid_size - 1:
-                        has_targets = True  # Player 1's unit can attack Player 2's tower
-                    elif owner == 2 and position - card.range <= 0:
-                        has_targets = True  # Player 2's unit can attack Player 1's tower
-                
-                # If ranged unit has targets in range, skip movement to allow attacking
-                if has_targets:
-                    continue
-            
-            # If not a ranged unit or no targets in range, proceed with movement
-            direction = 1 if owner == 1 else -1
-            new_position = position + direction
-            
-            # Check if movement is possible
-            if 0 <= new_position < self.grid_size and self.grid[new_position] == 0:
-                # Update grid
-                self.grid[position] = 0
-                self.grid[new_position] = unit_id
-                
-                # Update unit data
-                self.units[unit_id]['position'] = new_position
-                
-                # Mark the unit as moved (can't attack this turn)
-                self.moved_units.add(unit_id)
+        # Resolve stalemates (1-cell gaps between opposing units), then move units
+        # furthest from the enemy tower first, in a single kernel pass. Units that
+        # move are flagged in unit_moved (can't attack this turn). The kernel stops
+        # at every stalemate HP tie so the coin flip keeps using the global random
+        # state, in grid order, and is resumed after it.
+        ids = self._unit_ids()
+        empty_pos = _tick(self.grid, self.unit_pos, self.unit_owner, self.unit_hp, self.unit_range,
+                          self.unit_alive, self.unit_moved, ids, 1)
+        while empty_pos >= 0:
+            self._break_stalemate_tie(empty_pos)
+            empty_pos = _tick(self.grid, self.unit_pos, self.unit_owner, self.unit_hp, self.unit_range,
+                              self.unit_alive, self.unit_moved, ids, empty_pos + 2)
     
-    def _resolve_stalemates(self):
+    def _break_stalemate_tie(self, empty_pos):
         """
-        Resolve stalemate situations when there's a 1-cell gap between opposing units.
-        The unit with higher HP will move into the gap.
+        Resolve a stalemate between two opposing units with equal HP.
+        A coin flip picks which unit moves into the gap at empty_pos.
         """
-        # Find all empty cells
-        empty_cells = [i for i, cell in enumerate(self.grid) if cell == 0]
+        left_cell = int(self.grid[empty_pos - 1])
+        right_cell = int(self.grid[empty_pos + 1])
         
-        for empty_pos in empty_cells:
-            # Check cells on both sides of the empty cell
-            left_pos = empty_pos - 1
-            right_pos = empty_pos + 1
-            
-            # Ensure positions are within grid bounds
-            if left_pos < 0 or right_pos >= self.grid_size:
-                continue
-                
-            left_cell = self.grid[left_pos]
-            right_cell = self.grid[right_pos]
-            
-            # Skip if either cell isn't a unit
-            if not isinstance(left_cell, int) or not isinstance(right_cell, int):
-                continue
-                
-            # Skip if either unit doesn't exist anymore (might have been destroyed)
-            if left_cell not in self.units or right_cell not in self.units:
-                continue
-                
-            left_owner = self.units[left_cell]['owner']
-            right_owner = self.units[right_cell]['owner']
-            
-            # Check if this is a stalemate between opposing units
-            if left_owner != right_owner:
-                # Get HP values for both units
-                left_hp = self.units[left_cell]['card'].hp
-                right_hp = self.units[right_cell]['card'].hp
-                
-                # The unit with higher HP moves into the gap
-                if left_hp > right_hp:
-                    # Move left unit (if it's Player 1)
-                    if left_owner == 1:
-                        self.grid[left_pos] = 0
-                        self.grid[empty_pos] = left_cell
-                        self.units[left_cell]['position'] = empty_pos
-                        # Mark the unit as moved (can't attack this turn)
-                        self.moved_units.add(left_cell)
-                elif right_hp > left_hp:
-                    # Move right unit (if it's Player 2)
-                    if right_owner == 2:
-                        self.grid[right_pos] = 0
-                        self.grid[empty_pos] = right_cell
-                        self.units[right_cell]['position'] = empty_pos
-                        # Mark the unit as moved (can't attack this turn)
-                        self.moved_units.add(right_cell)
-                else:
-                    # If HP values are equal, randomly choose which unit moves
-                    # (This is a fallback for the rare case of equal HP)
-                    if random.choice([True, False]):
-                        # Move right unit (if it's Player 2)
-                        if right_owner == 2:
-                            self.grid[right_pos] = 0
-                            self.grid[empty_pos] = right_cell
-                            self.units[right_cell]['position'] = empty_pos
-                            # Mark the unit as moved (can't attack this turn)
-                            self.moved_units.add(right_cell)
-                    else:
-                        # Move left unit (if it's Player 1)
-                        if left_owner == 1:
-                            self.grid[left_pos] = 0
-                            self.grid[empty_pos] = left_cell
-                            self.units[left_cell]['position'] = empty_pos
-                            # Mark the unit as moved (can't attack this turn)
-                            self.moved_units.add(left_cell)
+        # If HP values are equal, randomly choose which unit moves
+        # (This is a fallback for the rare case of equal HP)
+        if self.rng.getrandbits(1):
+            # Move right unit (if it's Player 2)
+            if self.unit_owner[right_cell] == 2:
+                self._step_unit(right_cell, empty_pos + 1, empty_pos)
+        else:
+            # Move left unit (if it's Player 1)
+            if self.unit_owner[left_cell] == 1:
+                self._step_unit(left_cell, empty_pos - 1, empty_pos)
+    
+    def _step_unit(self, unit_id, position, new_position):
+        """Move a unit to an adjacent empty cell and mark it as moved."""
+        self.grid[position] = EMPTY
+        self.grid[new_position] = unit_id
+        self.unit_pos[unit_id] = new_position
+        # Mark the unit as moved (can't attack this turn)
+        self.unit_moved[unit_id] = True
     
     def _process_attacks(self):
         """Process all attacks for units that haven't moved this turn."""
         # Reset attacks for this turn
         self.current_attacks = []
         
-        # Make a copy of units to avoid modification during iteration
-        units_copy = dict(self.units)
-        
-        for unit_id, unit_data in units_copy.items():
-            # Skip units that moved this turn
-            if unit_id in self.moved_units:
-                continue
-                
-            position = unit_data['position']
-            owner = unit_data['owner']
-            card = unit_data['card']
-            
-            # Find targets within range
-            targets = []
-            for target_id, target_data in units_copy.items():
-                # Skip if target is on the same team
-                if target_data['owner'] == owner:
-                    continue
-                    
-                target_pos = target_data['position']
-                distance = abs(target_pos - position)
-                
-                # Check if target is within range
-                if distance <= card.range:
-                    targets.append((target_id, distance))
-            
-            # If no enemy units in range, check for tower
-            if not targets:
-                if owner == 1 and position + card.range >= self.grid_size - 1:
-                    # Player 1's unit can attack Player 2's tower
-                    self._attack_tower(unit_id, 2)
-                    self.current_attacks.append({
-                        'attacker_id': unit_id,
-                        'target_type': 'tower',
-                        'target_player': 2,
-                        'damage': card.attack
-                    })
-                elif owner == 2 and position - card.range <= 0:
-                    # Player 2's unit can attack Player 1's tower
-                    self._attack_tower(unit_id, 1)
-                    self.current_attacks.append({
-                        'attacker_id': unit_id,
-                        'target_type': 'tower',
-                        'target_player': 1,
-                        'damage': card.attack
-                    })
-                continue
-            
-            # Sort targets by distance (closest first)
-            targets.sort(key=lambda x: x[1])
-            
-            # Attack the closest target
-            target_id = targets[0][0]
-            self._attack_unit(unit_id, target_id)
-            self.current_attacks.append({
-                'attacker_id': unit_id,
-                'target_type': 'unit',
-                'target_id': target_id,
-                'damage': card.attack
-            })
-
-    def _attack_tower(self, attacker_id, tower_player):
-        """Process an attack on a tower."""
-        if attacker_id not in self.units:
-            return
-            
-        attacker = self.units[attacker_id]['card']
+        # Targets are chosen from the units alive at the start of the phase
+        ids = self._unit_ids()
+        kinds = np.empty(len(ids), dtype=np.int8)
+        targets = np.empty(len(ids), dtype=np.int64)
+        _select_targets(self.unit_pos, self.unit_owner, self.unit_range, ids, self.unit_moved,
+                        self.grid_size, kinds, targets)
         
-        # Apply damage to tower
-        if tower_player == 1:
-            self.grid[0] = 'T1'  # Tower is destroyed
-            self.game_over = True
-            self.winner = 2
-        else:
-            self.grid[-1] = 'T2'  # Tower is destroyed
+        # Apply damage in unit id order; destroyed units don't get to attack
+        winner, destroyed = _apply_attacks(self.grid, self.unit_pos, self.unit_hp, self.unit_attack,
+                                           self.unit_alive, ids, kinds, targets)
+        if destroyed:
+            self._ids = None
+            # Recount the units per player after losses
+            self.unit_counts = np.bincount(self.unit_owner[self.unit_alive], minlength=3).tolist()
+        if winner:
+            # A tower was destroyed
             self.game_over = True
-            self.winner = 1
-
-    def _attack_unit(self, attacker_id, defender_id):
-        """Process an attack between two units."""
-        # Verify both units still exist
-        if attacker_id not in self.units or defender_id not in self.units:
-            return
-            
-        attacker = self.units[attacker_id]['card']
-        defender = self.units[defender_id]['card']
-        
-        # Apply damage
-        defender.hp -= attacker.attack
-        
-        # Check if defender is destroyed
-        if defender.hp <= 0:
-            # Remove defender from the grid and units list
-            position = self.units[defender_id]['position']
-            self.grid[position] = 0
-            del self.units[defender_id]
+            self.winner = int(winner)
+        
+        # Record every attack that was picked, like the replays always have
+        damage = self.unit_attack[ids].tolist()
+        for unit_id, kind, target, unit_damage in zip(ids.tolist(), kinds.tolist(), targets.tolist(), damage):
+            if kind == UNIT_ATTACK:
+                self.current_attacks.append({
+                    'attacker_id': unit_id,
+                    'target_type': 'unit',
+                    'target_id': target,
+                    'damage': unit_damage
+                })
+            elif kind == TOWER_ATTACK:
+                self.current_attacks.append({
+                    'attacker_id': unit_id,
+                    'target_type': 'tower',
+                    'target_player': target,
+                    'damage': unit_damage
+                })
     
     def _check_win_conditions(self):
         """Check if any player has won."""
@@ -329,24 +493,65 @@ class GameEnvironment:
     
     def _get_state(self):
         """Return the current game state for replay and analysis."""
+        unit_pos = self.unit_pos.tolist()
+        unit_hp = self.unit_hp.tolist()
+        unit_attack = self.unit_attack.tolist()
+        unit_range = self.unit_range.tolist()
+        unit_owner = self.unit_owner.tolist()
+        unit_card = self.unit_card.tolist()
+        unit_moved = self.unit_moved.tolist()
+        
+        units = {}
+        for uid in self._unit_ids().tolist():
+            card_id = unit_card[uid]
+            units[uid] = {
+                'position': unit_pos[uid],
+                'card_name': self.cards.names[card_id],
+                'card_cost': self.cards.cost[card_id],
+                'hp': unit_hp[uid],
+                'attack': unit_attack[uid],
+                'range': unit_range[uid],
+                'owner': unit_owner[uid],
+                'moved_this_turn': unit_moved[uid]
+            }
+        
         return {
             'turn': self.turn_count,
-            'grid': self.grid.copy(),
-            'units': {uid: {
-                'position': data['position'],
-                'card_name': data['card'].name,
-                'card_cost': data['card'].cost,
-                'hp': data['card'].hp,
-                'attack': data['card'].attack,
-                'range': data['card'].range,
-                'owner': data['owner'],
-                'moved_this_turn': uid in self.moved_units
-            } for uid, data in self.units.items()},
+            'grid': [TOWER_LABELS.get(cell, cell) for cell in self.grid.tolist()],
+            'units': units,
             'attacks': self.current_attacks.copy(),  # Include attack information
             'game_over': self.game_over,
             'winner': self.winner
         }
-
+    
+    def _get_state_array(self):
+        """
+        Return the current game state with the units as a structured array.
+        
+        A cheaper snapshot than _get_state for collecting many states: the
+        grid is copied as is (towers stay TOWER1/TOWER2) and every unit is one
+        UNIT_STATE_DTYPE record, in ascending id order. Card names and costs
+        are looked up in self.cards by the card field.
+        """
+        ids = self._unit_ids()
+        units = np.empty(len(ids), dtype=UNIT_STATE_DTYPE)
+        units['id'] = ids
+        units['position'] = self.unit_pos[ids]
+        units['hp'] = self.unit_hp[ids]
+        units['attack'] = self.unit_attack[ids]
+        units['range'] = self.unit_range[ids]
+        units['owner'] = self.unit_owner[ids]
+        units['moved'] = self.unit_moved[ids]
+        units['card'] = self.unit_card[ids]
+        
+        return {
+            'turn': self.turn_count,
+            'grid': self.grid.copy(),
+            'units': units,
+            'game_over': self.game_over,
+            'winner': self.winner
+        }
+    
     def _set_state(self, state):
         """
         Restore a game state from replay data.
@@ -355,12 +560,12 @@ class GameEnvironment:
             state: Game state dictionary from _get_state()
         """
         # Reset the environment
-        self.grid = [0] * self.grid_size
-        self.grid[0] = 'T1'  # Player 1's tower
-        self.grid[-1] = 'T2'  # Player 2's tower
-        self.units = {}
+        self.grid = np.zeros(self.grid_size, dtype=np.int32)
+        self.grid[0] = TOWER1  # Player 1's tower
+        self.grid[-1] = TOWER2  # Player 2's tower
+        self.cards = CardRegistry()
+        self._allocate_units(INITIAL_UNIT_CAPACITY)
         self.next_unit_id = 1
-        self.moved_units = set()
         self.current_attacks = []
         
         # Restore turn count and game state
@@ -379,22 +584,16 @@ class GameEnvironment:
                 range=unit_data['range']
             )
             
-            # Add unit to the environment
-            self.units[int(unit_id)] = {
-                'position': unit_data['position'],
-                'card': card,
-                'owner': unit_data['owner']
-            }
-            
-            # Update grid
-            self.grid[unit_data['position']] = int(unit_id)
+            # Add unit to the environment and the grid
+            card_id = self.cards.register(card)
+            self._add_unit(int(unit_id), card_id, unit_data['hp'], unit_data['position'], unit_data['owner'])
             
             # Update next_unit_id
             self.next_unit_id = max(self.next_unit_id, int(unit_id) + 1)
             
-            # Add to moved_units if the unit moved this turn
+            # Flag the unit if it moved this turn
             if unit_data['moved_this_turn']:
-                self.moved_units.add(int(unit_id))
+                self.unit_moved[int(unit_id)] = True
         
         # Restore current attacks
-        self.current_attacks = state['attacks'].copy() 
\ No newline at end of file
+        self.current_attacks = state['attacks'].copy()
@@ -1,17 +1,29 @@
+import random
+
+
 class Player:
     """
     Manages player state, including elixir and card deck.
     """
     
+    is_ai = False  # Whether the game loop should call make_move for this player
+    
+    __slots__ = ('player_id', 'deck', 'max_elixir', 'elixir', 'hand', 'hand_costs', 'hand_name_ids',
+                 'next_card_index', 'max_units', 'last_played_card', 'last_played_name_id',
+                 'elixir_counter', '_min_cost')
+    
     def __init__(self, player_id, deck, max_elixir=10, initial_elixir=5, max_units=4):
         self.player_id = player_id
         self.deck = deck
         self.max_elixir = max_elixir
         self.elixir = initial_elixir
         self.hand = []  # Cards currently in hand
+        self.hand_costs = []  # Cost of each card in hand, kept in step with self.hand
+        self.hand_name_ids = []  # Name id of each card in hand, kept in step with self.hand
         self.next_card_index = 0
         self.max_units = max_units  # Maximum number of units a player can have on the field
         self.last_played_card = None  # Track the last card played by this player
+        self.last_played_name_id = -1  # Name id of last_played_card (-1 before any card is played)
         self.elixir_counter = 0  # Counter for fractional elixir generation
         
         # Initialize hand with 4 cards
@@ -19,13 +31,23 @@ class Player:
     
     def _refill_hand(self):
         """Fill hand with cards from deck until hand has 4 cards or deck is empty."""
-        while len(self.hand) < 4 and self.next_card_index < len(self.deck):
-            self.hand.append(self.deck[self.next_card_index])
+        # Deck length never changes and the hand grows by one per iteration
+        deck_len = len(self.deck)
+        hand_len = len(self.hand)
+        while hand_len < 4 and self.next_card_index < deck_len:
+            card = self.deck[self.next_card_index]
+            self.hand.append(card)
+            self.hand_costs.append(card.cost)
+            self.hand_name_ids.append(card.name_id)
             self.next_card_index += 1
+            hand_len += 1
             
             # If we've gone through the entire deck, loop back to the beginning
-            if self.next_card_index >= len(self.deck):
+            if self.next_card_index >= deck_len:
                 self.next_card_index = 0
+        
+        # Cheapest card in hand; below this much elixir nothing can be played
+        self._min_cost = min(self.hand_costs) if self.hand_costs else float('inf')
     
     def generate_elixir(self, amount=1/2):
         """
@@ -53,16 +75,16 @@ class Player:
         if not (0 <= hand_index < len(self.hand)):
             return False
             
-        if self.hand[hand_index].cost > self.elixir:
+        if self.hand_costs[hand_index] > self.elixir:
             return False
             
         # Check if player has reached the maximum number of units
-        unit_count = sum(1 for unit in game_env.units.values() if unit['owner'] == self.player_id)
+        unit_count = game_env.count_units(self.player_id)
         if unit_count >= self.max_units:
             return False
             
         # Check if this is the same card as the last one played
-        if self.last_played_card is not None and self.hand[hand_index].name == self.last_played_card.name:
+        if self.hand_name_ids[hand_index] == self.last_played_name_id:
             return False
             
         return True
@@ -82,6 +104,20 @@ class Player:
         if not self.can_play_card(hand_index, game_env):
             return None
         
+        return self._play_unchecked(hand_index, position, game_env)
+    
+    def _play_unchecked(self, hand_index, position, game_env):
+        """
+        Play a card that is already known to pass can_play_card.
+        
+        Args:
+            hand_index: Index of the card in the hand
+            position: Position on the grid to place the card
+            game_env: GameEnvironment instance
+            
+        Returns:
+            unit_id if successful, None otherwise
+        """
         card = self.hand[hand_index]
         
         # Place the card on the grid
@@ -96,34 +132,39 @@ class Player:
             card.reset()
             
             # Only update last_played_card if a different card was played
-            if self.last_played_card is None or card.name != self.last_played_card.name:
+            if card.name_id != self.last_played_name_id:
                 self.last_played_card = card
+                self.last_played_name_id = card.name_id
             
             return unit_id
         
         return None
     
-    def get_playable_cards(self, game_env):
+    def get_playable_cards(self, game_env, out=None):
         """
         Get a list of cards that can be played based on current elixir, unit limit, and last played card.
         
         Args:
             game_env: GameEnvironment instance to check unit count
+            out: List to clear and fill instead of creating a new one (optional)
             
         Returns:
             List of indices of playable cards
         """
+        playable_indices = out if out is not None else []
+        playable_indices.clear()
+        
         # Check if player has reached the maximum number of units
-        unit_count = sum(1 for unit in game_env.units.values() if unit['owner'] == self.player_id)
+        unit_count = game_env.count_units(self.player_id)
         if unit_count >= self.max_units:
-            return []
+            return playable_indices
             
         # Filter cards based on elixir cost and last played card
-        playable_indices = []
-        for i, card in enumerate(self.hand):
-            if card.cost <= self.elixir:
+        last_played_name_id = self.last_played_name_id
+        for i, cost in enumerate(self.hand_costs):
+            if cost <= self.elixir:
                 # Skip if this is the same card as the last one played
-                if self.last_played_card is None or card.name != self.last_played_card.name:
+                if self.hand_name_ids[i] != last_played_name_id:
                     playable_indices.append(i)
                     
         return playable_indices
@@ -137,9 +178,21 @@ class AIPlayer(Player):
     AI-controlled player with basic decision-making for card placement.
     """
     
-    def __init__(self, player_id, deck, max_elixir=10, initial_elixir=5, difficulty=1, max_units=4):
+    is_ai = True
+    
+    __slots__ = ('difficulty', '_valid_positions', '_rng', '_scratch_playable')
+    
+    def __init__(self, player_id, deck, max_elixir=10, initial_elixir=5, difficulty=1, max_units=4, seed=None, rng=None):
         super().__init__(player_id, deck, max_elixir, initial_elixir, max_units)
         self.difficulty = difficulty  # 1: Easy, 2: Medium, 3: Hard
+        # Use the given random generator (e.g. the game's), or a new one for a seed;
+        # otherwise share the global random state, so random.seed() makes games reproducible
+        if rng is not None:
+            self._rng = rng
+        else:
+            self._rng = random.Random(seed) if seed is not None else random
+        self._valid_positions = None  # Placement positions, built on the first move
+        self._scratch_playable = []  # Playable card list reused by every make_move call
     
     def make_move(self, game_env):
         """
@@ -151,42 +204,52 @@ class AIPlayer(Player):
         Returns:
             True if a move was made, False otherwise
         """
+        # Not enough elixir for even the cheapest card in hand
+        if self.elixir < self._min_cost:
+            return False
+        
         # Get playable cards (considering elixir, unit limit, and last played card)
-        playable_indices = self.get_playable_cards(game_env)
+        playable_indices = self.get_playable_cards(game_env, self._scratch_playable)
         
         if not playable_indices:
             return False
         
         # Simple AI: Always play the first playable card at a valid position
-        import random
-        
-        # Sort playable cards by cost (higher difficulty prefers higher cost cards)
-        if self.difficulty > 1:
-            playable_indices.sort(
-                key=lambda i: self.hand[i].cost,
-                reverse=(self.difficulty == 3)  # Hard AI prefers expensive cards
-            )
+        
+        # Pick the card by cost (higher difficulty prefers higher cost cards);
+        # min/max return the first card of that cost, like a stable sort would
+        if self.difficulty == 3:
+            # Hard AI prefers expensive cards
+            hand_index = max(playable_indices, key=self.hand_costs.__getitem__)
+        elif self.difficulty > 1:
+            hand_index = min(playable_indices, key=self.hand_costs.__getitem__)
         else:
             # Easy AI randomizes card choice
-            random.shuffle(playable_indices)
+            self._rng.shuffle(playable_indices)
+            hand_index = playable_indices[0]
         
-        # Try to play the selected card
-        for hand_index in playable_indices:
-            # Determine valid positions for this player
+        # Determine valid positions for this player (same for every move on this grid)
+        if self._valid_positions is None or self._valid_positions[0] != game_env.grid_size:
             if self.player_id == 1:
                 # Player 1 starts on the left side
-                valid_positions = list(range(1, game_env.grid_size // 2))
+                positions = tuple(range(1, game_env.grid_size // 2))
             else:
                 # Player 2 starts on the right side
-                valid_positions = list(range(game_env.grid_size // 2, game_env.grid_size - 1))
-            
-            # Shuffle positions for variety
-            random.shuffle(valid_positions)
-            
-            for position in valid_positions:
-                if game_env.grid[position] == 0:  # Position is empty
-                    result = self.play_card(hand_index, position, game_env)
-                    if result:
-                        return True
-                        
-        return False 
\ No newline at end of file
+                positions = tuple(range(game_env.grid_size // 2, game_env.grid_size - 1))
+            # Placement is only accepted next to the tower, so don't try the rest of the half
+            spawn_positions = game_env.spawn_positions(self.player_id)
+            positions = tuple(position for position in positions if position in spawn_positions)
+            self._valid_positions = (game_env.grid_size, positions)
+        
+        # Only empty positions can take a card; the grid doesn't change until one is played
+        grid = game_env.grid.tolist()
+        empty_positions = [position for position in self._valid_positions[1] if grid[position] == 0]
+        if not empty_positions:
+            return False
+        
+        # Shuffle positions for variety
+        self._rng.shuffle(empty_positions)
+        
+        # The card passed the can_play_card checks in get_playable_cards and the
+        # position is an empty spawn cell, so the first choice is always placed
+        return bool(self._play_unchecked(hand_index, empty_positions[0], game_env)) 
\ No newline at end of file
@@ -1,7 +1,9 @@
 import os
 import random
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import partial
 
 # Import game modules
 from game.environment import GameEnvironment
@@ -12,7 +14,11 @@ from game.player import Player, AIPlayer
 from replay.recorder import ReplayRecorder, ReplayLoader
 from replay.recorder import get_replay_summary
 
-def run_game(player1_type="human", player2_type="ai", turns=100, difficulty=2, seed=None, batch_index=None):
+# Sample cards shared by every game; units keep their own HP, so the cards never change
+SAMPLE_CARDS = tuple(create_sample_cards())
+
+def run_game(player1_type="human", player2_type="ai", turns=100, difficulty=2, seed=None, batch_index=None, record_every=1,
+             replay_format="json"):
     """
     Run a single game between two players.
     
@@ -23,20 +29,26 @@ def run_game(player1_type="human", player2_type="ai", turns=100, difficulty=2, s
         difficulty: AI difficulty (1-3)
         seed: Random seed for reproducibility (optional)
         batch_index: Index for batch-generated replays (optional)
-        
+        record_every: Record the game state every this many turns (the last turn is always recorded)
+        replay_format: "json" for the full replay, "json.gz" for the same gzip-compressed,
+            or "npz" for the columnar array log
+    
     Returns:
         Path to the saved replay file
     """
-    # Set random seed if provided
-    if seed is not None:
-        random.seed(seed)
+    if record_every < 1:
+        raise ValueError(f"record_every must be at least 1, got {record_every}")
+    
+    # One random generator per game, seeded if a seed is provided; it drives the
+    # deck shuffle, the AI and stalemate tie-breaks without touching the global state
+    rng = random.Random(seed)
     
     # Initialize game environment
-    game_env = GameEnvironment(grid_size=18)  # Updated to 18x1 grid
+    game_env = GameEnvironment(grid_size=18, rng=rng)  # Updated to 18x1 grid
     
     # Create card decks for players
-    sample_cards = create_sample_cards()
-    random.shuffle(sample_cards)
+    sample_cards = list(SAMPLE_CARDS)
+    rng.shuffle(sample_cards)
     
     # Split cards evenly between players
     half = len(sample_cards) // 2
@@ -49,12 +61,12 @@ def run_game(player1_type="human", player2_type="ai", turns=100, difficulty=2, s
     
     # Create players based on type
     if player1_type.lower() == "ai":
-        player1 = AIPlayer(1, player1_deck, difficulty=difficulty)
+        player1 = AIPlayer(1, player1_deck, difficulty=difficulty, rng=rng)
     else:
         player1 = Player(1, player1_deck)
     
     if player2_type.lower() == "ai":
-        player2 = AIPlayer(2, player2_deck, difficulty=difficulty)
+        player2 = AIPlayer(2, player2_deck, difficulty=difficulty, rng=rng)
     else:
         player2 = Player(2, player2_deck)
     
@@ -68,6 +80,12 @@ def run_game(player1_type="human", player2_type="ai", turns=100, difficulty=2, s
     recorder.add_metadata("player2_cards", [str(card) for card in player2_deck])
     if seed is not None:
         recorder.add_metadata("seed", seed)
+    if record_every != 1:
+        recorder.add_metadata("record_every", record_every)
+    
+    # Which players the AI controls doesn't change during the game
+    player1_ai = player1.is_ai
+    player2_ai = player2.is_ai
     
     # Main game loop
     for turn in range(1, turns + 1):
@@ -75,9 +93,9 @@ def run_game(player1_type="human", player2_type="ai", turns=100, difficulty=2, s
         game_env._process_movements()
         
         # PHASE 2: Unit Placement
-        if isinstance(player1, AIPlayer):
+        if player1_ai:
             player1.make_move(game_env)
-        if isinstance(player2, AIPlayer):
+        if player2_ai:
             player2.make_move(game_env)
         
         # PHASE 3: Attacks
@@ -88,17 +106,31 @@ def run_game(player1_type="human", player2_type="ai", turns=100, difficulty=2, s
         player1.generate_elixir()
         player2.generate_elixir()
         
-        # Record game state
-        recorder.record_state(game_env._get_state())
+        # Record game state (snapshots are skipped between recorded turns)
+        if turn % record_every == 0 or game_env.game_over or turn == turns:
+            if replay_format == "npz":
+                recorder.record_state_array(game_env._get_state_array())
+            else:
+                recorder.record_state(game_env._get_state())
         
         # Check if game is over
         if game_env.game_over:
             break
     
     # Save replay
-    return recorder.save(batch_index=batch_index)
+    if replay_format == "npz":
+        # Units refer to the environment's card table by card id
+        recorder.add_metadata("card_names", game_env.cards.names)
+        recorder.add_metadata("card_costs", game_env.cards.cost)
+        return recorder.save_arrays(batch_index=batch_index)
+    return recorder.save(batch_index=batch_index, compress=replay_format == "json.gz")
+
+def _run_batch_game(index, **kwargs):
+    """Run one batch game, using its index as the seed (module level so worker processes can run it)."""
+    return run_game(seed=index, batch_index=index, **kwargs)
 
-def batch_generate_replays(count=10, player1_type="ai", player2_type="ai", turns=100, difficulty=2):
+def batch_generate_replays(count=10, player1_type="ai", player2_type="ai", turns=100, difficulty=2, record_every=1, workers=None,
+                           replay_format="json"):
     """
     Generate multiple game replays.
     
@@ -108,28 +140,48 @@ def batch_generate_replays(count=10, player1_type="ai", player2_type="ai", turns
         player2_type: Type of player 2 ("human" or "ai")
         turns: Maximum number of turns
         difficulty: AI difficulty level (1-3)
-        
+        record_every: Record the game state every this many turns
+        workers: Number of worker processes (defaults to the number of CPU cores)
+        replay_format: "json", "json.gz" or "npz" (see run_game)
+    
     Returns:
         List of paths to saved replay files
     """
+    if record_every < 1:
+        raise ValueError(f"record_every must be at least 1, got {record_every}")
+    
     replay_paths = []
     
+    # Use the index as a seed for reproducibility
+    run_one = partial(
+        _run_batch_game,
+        player1_type=player1_type,
+        player2_type=player2_type,
+        turns=turns,
+        difficulty=difficulty,
+        record_every=record_every,
+        replay_format=replay_format
+    )
+    
     print(f"Generating {count} replays...")
-    for i in range(count):
-        # Use the index as a seed for reproducibility
-        replay_path = run_game(
-            player1_type=player1_type,
-            player2_type=player2_type,
-            turns=turns,
-            difficulty=difficulty,
-            seed=i,
-            batch_index=i
-        )
-        replay_paths.append(replay_path)
-        print(f"Generated replay {i+1}/{count}: {os.path.basename(replay_path)}")
+    # Games are independent, so run them on all CPU cores
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for i, replay_path in enumerate(executor.map(run_one, range(count))):
+            replay_paths.append(replay_path)
+            print(f"Generated replay {i+1}/{count}: {os.path.basename(replay_path)}")
     
     return replay_paths
 
+def _positive_int(value):
+    """Argparse type for options that must be a whole number of at least 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
 def main():
     """Main function to parse arguments and run the game."""
     parser = argparse.ArgumentParser(description="Clash Royale Prototype")
@@ -144,6 +196,8 @@ def main():
     play_parser.add_argument("--turns", type=int, default=100, help="Maximum number of turns")
     play_parser.add_argument("--difficulty", type=int, choices=[1, 2, 3], default=2, help="AI difficulty")
     play_parser.add_argument("--seed", type=int, help="Random seed for reproducibility")
+    play_parser.add_argument("--record-every", type=_positive_int, default=1, help="Record the game state every N turns")
+    play_parser.add_argument("--format", choices=["json", "json.gz", "npz"], default="json", help="Replay file format")
     
     # Parser for the 'batch' command
     batch_parser = subparsers.add_parser("batch", help="Generate a batch of replays")
@@ -152,6 +206,9 @@ def main():
     batch_parser.add_argument("--player2", choices=["human", "ai"], default="ai", help="Player 2 type")
     batch_parser.add_argument("--turns", type=int, default=100, help="Maximum number of turns")
     batch_parser.add_argument("--difficulty", type=int, choices=[1, 2, 3], default=2, help="AI difficulty")
+    batch_parser.add_argument("--record-every", type=_positive_int, default=1, help="Record the game state every N turns")
+    batch_parser.add_argument("--workers", type=int, help="Number of worker processes (default: all CPU cores)")
+    batch_parser.add_argument("--format", choices=["json", "json.gz", "npz"], default="json", help="Replay file format")
     
     # Parse arguments
     args = parser.parse_args()
@@ -166,20 +223,25 @@ def main():
             args.player2, 
             args.turns, 
             args.difficulty,
-            args.seed
+            args.seed,
+            record_every=args.record_every,
+            replay_format=args.format
         )
         print(f"Game completed! Replay saved to: {replay_path}")
-        
+    
     elif args.command == "batch":
         replay_paths = batch_generate_replays(
             args.count,
             args.player1,
             args.player2,
             args.turns,
-            args.difficulty
+            args.difficulty,
+            record_every=args.record_every,
+            workers=args.workers,
+            replay_format=args.format
         )
         print(f"\nGenerated {len(replay_paths)} replays in the 'replays' directory")
-        
+    
     else:
         parser.print_help()
 
@@ -1,7 +1,40 @@
+import gzip
 import json
 import os
 import time
+import zlib
 from datetime import datetime
+from functools import partial
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    # orjson is optional; the standard library encoder writes the same JSON, only slower
+    orjson = None
+
+# First bytes of a gzip file
+GZIP_MAGIC = b"\x1f\x8b"
+
+# JSON encoder without whitespace between items, for compact replay files
+_COMPACT_ENCODER = json.JSONEncoder(separators=(",", ":"))
+
+
+def _encode_compact(obj):
+    """Encode obj as compact UTF-8 JSON, with orjson when it is installed."""
+    if orjson is not None:
+        # Unit ids are int keys, which orjson only accepts with this option
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return _COMPACT_ENCODER.encode(obj).encode()
+
+
+def _decode(data):
+    """Decode JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
 
 class ReplayRecorder:
     """
@@ -10,75 +43,178 @@ class ReplayRecorder:
     
     def __init__(self, base_dir="replays"):
         self.base_dir = base_dir
-        self.states = []
+        self.deltas = []  # Changes from each recorded state to the next (see _diff_states)
+        self.array_states = []  # Snapshots from GameEnvironment._get_state_array()
+        self.reset()
+        
+        # Create replays directory if it doesn't exist
+        os.makedirs(base_dir, exist_ok=True)
+    
+    def reset(self):
+        """
+        Clear the recorded states and metadata to record another game.
+        
+        Lets one recorder be reused for many games in a process, without
+        creating the replay directory again for each one.
+        """
+        self.base_state = None  # First recorded state
+        self.deltas.clear()
+        self.state_count = 0
+        self._last_state = None
+        self.array_states.clear()
         self.metadata = {
             "start_time": time.time(),
             "game_version": "0.1",
-            "replay_version": "0.1"
+            "replay_version": "0.2"
         }
-        
-        # Create replays directory if it doesn't exist
-        os.makedirs(base_dir, exist_ok=True)
     
     def record_state(self, state):
         """
         Record a game state.
         
+        Only the first state is kept whole; every later one is stored as its
+        changes from the previous state. The state must not be modified after
+        it is recorded (GameEnvironment._get_state() builds a new one each call).
+        
         Args:
             state: Game state dictionary from GameEnvironment._get_state()
         """
-        self.states.append(state)
+        if self._last_state is None:
+            self.base_state = state
+        else:
+            self.deltas.append(_diff_states(self._last_state, state))
+        self._last_state = state
+        self.state_count += 1
+    
+    def record_state_array(self, state):
+        """
+        Record a game state snapshot without building per-unit dicts.
+        
+        Args:
+            state: Game state dictionary from GameEnvironment._get_state_array()
+        """
+        self.array_states.append(state)
     
     def add_metadata(self, key, value):
         """Add metadata to the replay."""
         self.metadata[key] = value
     
-    def save(self, filename=None, batch_index=None):
+    def _default_filename(self, batch_index, extension):
+        """Build a timestamp-based replay filename."""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        if batch_index is not None:
+            return f"replay_{timestamp}_batch{batch_index:03d}{extension}"
+        return f"replay_{timestamp}{extension}"
+    
+    def _finish_metadata(self, last_state, batch_index):
+        """Add the end time, turn count, winner and batch index to the metadata."""
+        # Add end time to metadata
+        self.metadata["end_time"] = time.time()
+        self.metadata["duration"] = self.metadata["end_time"] - self.metadata["start_time"]
+        # States may be recorded only every few turns, so count turns from the last one
+        self.metadata["turn_count"] = last_state["turn"] if last_state else 0
+        
+        # Add game result to metadata
+        if last_state and last_state["game_over"]:
+            self.metadata["winner"] = last_state["winner"]
+        
+        # Add batch index to metadata if provided
+        if batch_index is not None:
+            self.metadata["batch_index"] = batch_index
+    
+    def save(self, filename=None, batch_index=None, pretty=False, compress=False):
         """
         Save the replay to a file.
         
+        The file holds the metadata, the first state ("base_state") and the
+        changes to each following state ("deltas"); ReplayLoader.load rebuilds
+        the full list of states. Filenames ending in .gz are gzip-compressed.
+        
         Args:
             filename: Custom filename, if None a timestamp-based name will be generated
             batch_index: Optional index for batch-generated replays
-            
+            pretty: Indent the JSON for reading (slower and larger)
+            compress: Gzip the generated filename (.json.gz); ignored for a custom filename
+        
         Returns:
             The path to the saved replay file
         """
         if not filename:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            if batch_index is not None:
-                filename = f"replay_{timestamp}_batch{batch_index:03d}.json"
-            else:
-                filename = f"replay_{timestamp}.json"
+            filename = self._default_filename(batch_index, ".json.gz" if compress else ".json")
         
-        # Add end time to metadata
-        self.metadata["end_time"] = time.time()
-        self.metadata["duration"] = self.metadata["end_time"] - self.metadata["start_time"]
-        self.metadata["turn_count"] = len(self.states)
+        self._finish_metadata(self._last_state, batch_index)
         
-        # Add game result to metadata
-        if self.states and self.states[-1]["game_over"]:
-            self.metadata["winner"] = self.states[-1]["winner"]
+        # Save to file
+        filepath = os.path.join(self.base_dir, filename)
+        if filename.endswith(".gz"):
+            # Level 3 compresses replays nearly as well as the default 9, several times faster
+            open_file = partial(gzip.open, compresslevel=3)
+        else:
+            open_file = open
+        if pretty:
+            replay_data = {
+                "metadata": self.metadata,
+                "base_state": self.base_state,
+                "deltas": self.deltas
+            }
+            with open_file(filepath, 'wt') as f:
+                json.dump(replay_data, f, indent=2)
+        else:
+            with open_file(filepath, 'wb') as f:
+                # Write the deltas one by one instead of encoding one big string
+                f.write(b'{"metadata":' + _encode_compact(self.metadata))
+                f.write(b',"base_state":' + _encode_compact(self.base_state))
+                f.write(b',"deltas":[')
+                for i, delta in enumerate(self.deltas):
+                    f.write(b"," + _encode_compact(delta) if i else _encode_compact(delta))
+                f.write(b']}')
         
-        # Add batch index to metadata if provided
-        if batch_index is not None:
-            self.metadata["batch_index"] = batch_index
+        return filepath
+    
+    def save_arrays(self, filename=None, batch_index=None):
+        """
+        Save the array snapshots as a columnar .npz replay.
         
-        # Prepare final replay data
-        replay_data = {
-            "metadata": self.metadata,
-            "states": self.states
-        }
+        Every field is one array over all recorded states: turn, game_over,
+        winner (0 while the game is running) and grid (states x grid_size). The
+        units of all states are concatenated into one structured array;
+        units[unit_offsets[i]:unit_offsets[i+1]] are the units of state i. The
+        metadata is stored as a JSON string. Attacks are not recorded.
+        
+        Args:
+            filename: Custom filename, if None a timestamp-based name will be generated
+            batch_index: Optional index for batch-generated replays
+        
+        Returns:
+            The path to the saved replay file
+        """
+        if not filename:
+            filename = self._default_filename(batch_index, ".npz")
+        
+        states = self.array_states
+        self._finish_metadata(states[-1] if states else None, batch_index)
+        
+        unit_counts = [len(state["units"]) for state in states]
+        unit_offsets = np.zeros(len(states) + 1, dtype=np.int64)
+        np.cumsum(unit_counts, out=unit_offsets[1:])
         
         # Save to file
         filepath = os.path.join(self.base_dir, filename)
-        with open(filepath, 'w') as f:
-            json.dump(replay_data, f, indent=2)
+        np.savez(
+            filepath,
+            metadata=json.dumps(self.metadata),
+            turn=np.array([state["turn"] for state in states], dtype=np.int32),
+            game_over=np.array([state["game_over"] for state in states], dtype=np.bool_),
+            winner=np.array([state["winner"] or 0 for state in states], dtype=np.int8),
+            grid=np.stack([state["grid"] for state in states]) if states else np.zeros((0, 0), dtype=np.int32),
+            unit_offsets=unit_offsets,
+            units=np.concatenate([state["units"] for state in states]) if states else np.zeros(0)
+        )
         
         return filepath
     
     def __len__(self):
-        return len(self.states)
+        return self.state_count
 
 
 class ReplayLoader:
@@ -88,25 +224,59 @@ class ReplayLoader:
     
     def __init__(self, base_dir="replays"):
         self.base_dir = base_dir
+        self._listing = None  # (directory mtime, replay filenames) from the last list_replays call
     
     def load(self, filename):
         """
         Load a replay from file.
         
+        Delta-encoded replays are expanded, so the result always has the full
+        list of states under "states". Unchanged units are shared between
+        consecutive states. Gzip-compressed files are recognised by their
+        first bytes, whatever their name.
+        
         Args:
             filename: The replay filename
-            
+        
         Returns:
             Replay data dictionary or None if file not found
         """
         filepath = os.path.join(self.base_dir, filename)
         
         try:
-            with open(filepath, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
+            with open(filepath, 'rb') as f:
+                data = f.read()
+            if data[:2] == GZIP_MAGIC:
+                data = gzip.decompress(data)
+            replay_data = _decode(data)
+        except (FileNotFoundError, EOFError, gzip.BadGzipFile, zlib.error, json.JSONDecodeError) as e:
             print(f"Error loading replay: {e}")
             return None
+        
+        if "deltas" in replay_data:
+            replay_data["states"] = _expand_states(replay_data.pop("base_state"), replay_data.pop("deltas"))
+        return replay_data
+    
+    def load_arrays(self, filename):
+        """
+        Load a columnar replay written by ReplayRecorder.save_arrays.
+        
+        Args:
+            filename: The replay filename
+        
+        Returns:
+            Dictionary with the metadata and one array per column, or None if file not found
+        """
+        filepath = os.path.join(self.base_dir, filename)
+        
+        try:
+            with np.load(filepath) as data:
+                replay_data = {key: data[key] for key in data.files}
+        except (FileNotFoundError, ValueError) as e:
+            print(f"Error loading replay: {e}")
+            return None
+        replay_data["metadata"] = json.loads(str(replay_data["metadata"]))
+        return replay_data
     
     def list_replays(self):
         """
@@ -116,9 +286,86 @@ class ReplayLoader:
             List of replay filenames
         """
         try:
-            return [f for f in os.listdir(self.base_dir) if f.endswith('.json')]
+            # Adding, removing or renaming a file changes the directory's mtime
+            mtime = os.stat(self.base_dir).st_mtime_ns
+            if self._listing is not None and self._listing[0] == mtime:
+                return list(self._listing[1])
+            
+            with os.scandir(self.base_dir) as entries:
+                filenames = [entry.name for entry in entries
+                             if entry.name.endswith(('.json', '.json.gz')) and entry.is_file()]
         except FileNotFoundError:
             return []
+        
+        self._listing = (mtime, filenames)
+        return list(filenames)
+
+
+def _diff_states(previous, state):
+    """
+    Compute the changes from one recorded state to the next.
+    
+    Args:
+        previous: The previous game state dictionary
+        state: The next game state dictionary
+    
+    Returns:
+        Dictionary with the top-level fields that changed; its "units" entry, if
+        any, has the "added" units, the "removed" unit ids and the "changed"
+        fields of the other units
+    """
+    delta = {key: value for key, value in state.items() if key != "units" and previous.get(key) != value}
+    
+    previous_units = previous["units"]
+    units = state["units"]
+    added = {}
+    changed = {}
+    for unit_id, unit_data in units.items():
+        previous_data = previous_units.get(unit_id)
+        if previous_data is None:
+            added[unit_id] = unit_data
+        elif previous_data != unit_data:
+            changed[unit_id] = {key: value for key, value in unit_data.items() if previous_data.get(key) != value}
+    # Unit ids are stored as strings, like the keys of a JSON object
+    removed = [str(unit_id) for unit_id in previous_units if unit_id not in units]
+    
+    if added or removed or changed:
+        delta["units"] = {"added": added, "removed": removed, "changed": changed}
+    return delta
+
+
+def _expand_states(base_state, deltas):
+    """
+    Rebuild the full list of states from a loaded delta-encoded replay.
+    
+    Args:
+        base_state: The first state
+        deltas: Changes to each following state from _diff_states
+    
+    Returns:
+        List of game state dictionaries
+    """
+    if base_state is None:
+        return []
+    
+    states = [base_state]
+    state = base_state
+    for delta in deltas:
+        state = {**state, **delta}
+        units_delta = delta.get("units")
+        if units_delta is None:
+            # The units dict is shared with the previous state
+            state["units"] = states[-1]["units"]
+        else:
+            units = dict(states[-1]["units"])
+            for unit_id in units_delta["removed"]:
+                del units[unit_id]
+            for unit_id, fields in units_delta["changed"].items():
+                units[unit_id] = {**units[unit_id], **fields}
+            units.update(units_delta["added"])
+            state["units"] = units
+        states.append(state)
+    return states
 
 
 def get_replay_summary(replay_data):
@@ -127,7 +374,7 @@ def get_replay_summary(replay_data):
     
     Args:
         replay_data: Loaded replay data
-        
+    
     Returns:
         Dictionary with replay summary information
     """
@@ -137,9 +384,14 @@ def get_replay_summary(replay_data):
     metadata = replay_data.get("metadata", {})
     states = replay_data.get("states", [])
     
+    # Columnar replays from ReplayLoader.load_arrays
+    if "unit_offsets" in replay_data:
+        return _get_array_replay_summary(replay_data, metadata)
+    
     summary = {
         "duration": metadata.get("duration", 0),
-        "turns": len(states),
+        # Game turns; with record_every > 1 there are fewer states than turns
+        "turns": metadata.get("turn_count", len(states)),
         "winner": metadata.get("winner"),
         "start_time": datetime.fromtimestamp(metadata.get("start_time", 0)).strftime("%Y-%m-%d %H:%M:%S"),
         "game_version": metadata.get("game_version", "unknown")
@@ -147,29 +399,53 @@ def get_replay_summary(replay_data):
     
     # Add more detailed statistics if states are available
     if states:
-        # Count units played by each player
-        units_played = {1: 0, 2: 0}
-        
-        # Track units on field at end of each turn
-        units_over_time = []
-        
-        for state in states:
-            # Count units by owner
-            units_by_owner = {1: 0, 2: 0}
-            for unit_data in state.get("units", {}).values():
-                units_by_owner[unit_data["owner"]] += 1
-            
-            units_over_time.append(units_by_owner)
-        
-        # Calculate unit statistics
-        summary["max_units"] = {
-            1: max([u.get(1, 0) for u in units_over_time]),
-            2: max([u.get(2, 0) for u in units_over_time])
-        }
-        
-        summary["avg_units"] = {
-            1: sum([u.get(1, 0) for u in units_over_time]) / len(units_over_time),
-            2: sum([u.get(2, 0) for u in units_over_time]) / len(units_over_time)
-        }
+        # Owner of every unit of every state, with the index of its state
+        unit_counts = [len(state.get("units", {})) for state in states]
+        state_index = np.repeat(np.arange(len(states)), unit_counts)
+        owner = np.fromiter(
+            (unit_data["owner"] for state in states for unit_data in state.get("units", {}).values()),
+            dtype=np.int64,
+            count=len(state_index)
+        )
+        _add_unit_statistics(summary, state_index, owner, len(states))
+    
+    return summary 
+
+
+def _get_array_replay_summary(replay_data, metadata):
+    """get_replay_summary for a columnar replay, counting units with one bincount."""
+    state_count = len(replay_data["turn"])
+    summary = {
+        "duration": metadata.get("duration", 0),
+        # Game turns; with record_every > 1 there are fewer states than turns
+        "turns": metadata.get("turn_count", state_count),
+        "winner": metadata.get("winner"),
+        "start_time": datetime.fromtimestamp(metadata.get("start_time", 0)).strftime("%Y-%m-%d %H:%M:%S"),
+        "game_version": metadata.get("game_version", "unknown")
+    }
+    
+    if state_count:
+        state_index = np.repeat(np.arange(state_count), np.diff(replay_data["unit_offsets"]))
+        owner = replay_data["units"]["owner"].astype(np.int64)
+        _add_unit_statistics(summary, state_index, owner, state_count)
+    
+    return summary
+
+
+def _add_unit_statistics(summary, state_index, owner, state_count):
+    """
+    Add the maximum and average number of units on field per player to a summary.
+    
+    Averages are taken over the recorded states, not over all game turns.
+    
+    Args:
+        summary: Summary dictionary to update
+        state_index: Index of the state of every unit
+        owner: Owner (1 or 2) of every unit
+        state_count: Number of states
+    """
+    # Units on field per state and owner: row = state index, column = owner
+    counts = np.bincount(state_index * 3 + owner, minlength=state_count * 3).reshape(state_count, 3)
     
-    return summary 
\ No newline at end of file
+    summary["max_units"] = {1: int(counts[:, 1].max()), 2: int(counts[:, 2].max())}
+    summary["avg_units"] = {1: float(counts[:, 1].mean()), 2: float(counts[:, 2].mean())}
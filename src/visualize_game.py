@@ -7,12 +7,13 @@ import numpy as np
 import random
 from matplotlib.colors import LinearSegmentedColormap
 
-# Add the src directory to the path so we can import our modules
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Add the src directory to the path so we can import our modules. They must be
+# imported as game.* like in main.py: numba's kernel cache records the module name
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from src.game.environment import GameEnvironment
-from src.game.card import Card, CardDeck, create_sample_cards
-from src.game.player import Player, AIPlayer
+from game.environment import GameEnvironment, EMPTY, TOWER1, TOWER2
+from game.card import Card, CardDeck, create_sample_cards
+from game.player import Player, AIPlayer
 
 class GameVisualizer:
     """
@@ -71,15 +72,32 @@ class GameVisualizer:
             player1: Optional Player 1 instance (None for replay visualization)
             player2: Optional Player 2 instance (None for replay visualization)
         """
+        # Both views show the unit counts, so count them once per state
+        unit_counts = self._count_units(game_env)
+        
         if self.use_ascii:
-            self._visualize_ascii(game_env, player1, player2)
+            self._visualize_ascii(game_env, player1, player2, unit_counts)
         
         if self.use_matplotlib:
-            self._visualize_matplotlib(game_env, player1, player2)
+            self._visualize_matplotlib(game_env, player1, player2, unit_counts)
+            
+        if self.delay > 0:
+            time.sleep(self.delay)
+    
+    def _count_units(self, game_env):
+        """
+        Get the number of units of each player.
+        
+        Args:
+            game_env: GameEnvironment instance
             
-        time.sleep(self.delay)
+        Returns:
+            Tuple of (player 1 unit count, player 2 unit count)
+        """
+        # The environment keeps the counts up to date, so nothing is built per frame
+        return game_env.count_units(1), game_env.count_units(2)
     
-    def _visualize_ascii(self, game_env, player1=None, player2=None):
+    def _visualize_ascii(self, game_env, player1=None, player2=None, unit_counts=None):
         """
         Visualize the game state using ASCII characters.
         
@@ -87,9 +105,21 @@ class GameVisualizer:
             game_env: GameEnvironment instance
             player1: Optional Player 1 instance (None for replay visualization)
             player2: Optional Player 2 instance (None for replay visualization)
+            unit_counts: Optional (player 1, player 2) unit counts from _count_units
         """
-        # Clear the console
-        os.system('cls' if os.name == 'nt' else 'clear')
+        is_tty = sys.stdout.isatty()
+        
+        # Skip the output entirely when it is piped and REPLAY_QUIET is set
+        if not is_tty and os.environ.get("REPLAY_QUIET"):
+            return
+        
+        # Clear the console (piped output is not a screen, so leave it as is)
+        if is_tty:
+            if os.name == 'nt':
+                os.system('cls')
+            else:
+                # ANSI "cursor home, clear screen", without starting a clear process every frame
+                sys.stdout.write("\x1b[H\x1b[2J")
         
         # Print turn information
         print(f"Turn: {game_env.turn_count}")
@@ -110,8 +140,7 @@ class GameVisualizer:
         print("\n" + "="*50 + "\n")  # Separator line
         
         # Count units for each player
-        p1_units = sum(1 for unit in game_env.units.values() if unit['owner'] == 1)
-        p2_units = sum(1 for unit in game_env.units.values() if unit['owner'] == 2)
+        p1_units, p2_units = unit_counts if unit_counts is not None else self._count_units(game_env)
         
         # Print elixir and unit counts if player info is available
         if player1 is not None:
@@ -139,21 +168,21 @@ class GameVisualizer:
             
         print()
         
-        # Print the grid
+        # Print the grid (plain lists are much cheaper to index per cell than numpy arrays)
+        unit_owner = game_env.unit_owner.tolist()
+        unit_moved = game_env.unit_moved.tolist()
         grid_repr = []
-        for i in range(game_env.grid_size):
-            cell = game_env.grid[i]
-            if cell == 'T1':
+        for cell in game_env.grid.tolist():
+            if cell == TOWER1:
                 grid_repr.append('🏰1')  # Castle emoji for Player 1's tower
-            elif cell == 'T2':
+            elif cell == TOWER2:
                 grid_repr.append('🏰2')  # Castle emoji for Player 2's tower
-            elif cell == 0:
+            elif cell == EMPTY:
                 grid_repr.append('··')  # Empty space
             else:
                 # It's a unit
-                unit_data = game_env.units.get(cell, {})
-                owner = unit_data.get('owner', '?')
-                moved = cell in game_env.moved_units  # Check if unit moved this turn
+                owner = unit_owner[cell]
+                moved = unit_moved[cell]  # Check if unit moved this turn
                 
                 if owner == 1:
                     grid_repr.append('🔵' if not moved else '🔷')  # Blue circle (solid for ready, hollow for moved)
@@ -162,28 +191,29 @@ class GameVisualizer:
                 else:
                     grid_repr.append('??')
         
-        # Print the grid with indices
-        print("+" + "-" * (game_env.grid_size * 3 - 1) + "+")
-        print("|", end="")
-        for i, cell in enumerate(grid_repr):
-            print(f" {cell}", end="")
-        print(" |")
-        print("|", end="")
-        for i in range(game_env.grid_size):
-            print(f"{i:2d}", end=" ")
-        print("|")
-        print("+" + "-" * (game_env.grid_size * 3 - 1) + "+")
+        # Print the grid with indices, one print call per line
+        border = "+" + "-" * (game_env.grid_size * 3 - 1) + "+"
+        print(border)
+        print("|" + "".join(f" {cell}" for cell in grid_repr) + " |")
+        print("|" + "".join(f"{i:2d} " for i in range(game_env.grid_size)) + "|")
+        print(border)
         print()
         
         # Print units with details
         print("Units on the field:")
-        for unit_id, unit_data in game_env.units.items():
-            card = unit_data['card']
-            owner = unit_data['owner']
-            position = unit_data['position']
-            moved = unit_id in game_env.moved_units
+        # Read the unit arrays directly instead of building a Card per unit through game_env.units
+        card_names = game_env.cards.names
+        unit_card = game_env.unit_card.tolist()
+        unit_pos = game_env.unit_pos.tolist()
+        unit_hp = game_env.unit_hp.tolist()
+        unit_attack = game_env.unit_attack.tolist()
+        unit_range = game_env.unit_range.tolist()
+        for unit_id in game_env._unit_ids().tolist():
+            owner = unit_owner[unit_id]
+            moved = unit_moved[unit_id]
             status = "MOVED (can't attack)" if moved else "READY"
-            print(f"  Player {owner} - {card.name} at position {position}: HP={card.hp}, ATK={card.attack}, Range={card.range} - {status}")
+            print(f"  Player {owner} - {card_names[unit_card[unit_id]]} at position {unit_pos[unit_id]}: "
+                  f"HP={unit_hp[unit_id]}, ATK={unit_attack[unit_id]}, Range={unit_range[unit_id]} - {status}")
         
         # Print game status
         if game_env.game_over:
@@ -194,7 +224,7 @@ class GameVisualizer:
         print("Note: Players cannot play the same card twice in a row")
         print("Note: Units can attack any enemy within their range")
 
-    def _visualize_matplotlib(self, game_env, player1=None, player2=None):
+    def _visualize_matplotlib(self, game_env, player1=None, player2=None, unit_counts=None):
         """
         Visualize the game state using matplotlib.
         
@@ -202,6 +232,7 @@ class GameVisualizer:
             game_env: GameEnvironment instance
             player1: Optional Player 1 instance
             player2: Optional Player 2 instance
+            unit_counts: Optional (player 1, player 2) unit counts from _count_units
         """
         if not self.use_matplotlib:
             return
@@ -220,8 +251,8 @@ class GameVisualizer:
                 enemy_tower = next((t for t in game_env.towers if t.team == 'enemy'), None)
             # If that fails, try getting them from grid state
             elif hasattr(game_env, 'grid'):
-                player_tower_cell = next((i for i, cell in enumerate(game_env.grid) if cell == 'T1'), None)
-                enemy_tower_cell = next((i for i, cell in enumerate(game_env.grid) if cell == 'T2'), None)
+                player_tower_cell = next((i for i, cell in enumerate(game_env.grid) if cell == TOWER1), None)
+                enemy_tower_cell = next((i for i, cell in enumerate(game_env.grid) if cell == TOWER2), None)
                 if player_tower_cell is not None and enemy_tower_cell is not None:
                     player_tower = {"hp": 100, "max_hp": 100}  # Using default values
                     enemy_tower = {"hp": 100, "max_hp": 100}
@@ -245,21 +276,22 @@ class GameVisualizer:
         self.current_state["score"] = round(score, 1)
         self.current_state["game_over"] = True if hasattr(game_env, 'game_over') and game_env.game_over else False
         
-        # Plot the grid
-        for i in range(game_env.grid_size):
-            cell = game_env.grid[i]
-            if cell == 'T1':
+        # Plot the grid, reading units from the environment arrays instead of game_env.units
+        unit_owner = game_env.unit_owner.tolist()
+        unit_moved = game_env.unit_moved.tolist()
+        unit_hp = game_env.unit_hp.tolist()
+        unit_range = game_env.unit_range.tolist()
+        for i, cell in enumerate(game_env.grid.tolist()):
+            if cell == TOWER1:
                 self.ax.add_patch(plt.Rectangle((i-0.4, 0.1), 0.8, 0.8, fill=True, color='blue', alpha=0.8))
                 self.ax.text(i, 0.5, "T1", ha='center', va='center', color='white', fontweight='bold')
-            elif cell == 'T2':
+            elif cell == TOWER2:
                 self.ax.add_patch(plt.Rectangle((i-0.4, 0.1), 0.8, 0.8, fill=True, color='red', alpha=0.8))
                 self.ax.text(i, 0.5, "T2", ha='center', va='center', color='white', fontweight='bold')
-            elif cell != 0:
+            elif cell != EMPTY:
                 # It's a unit
-                unit_data = game_env.units.get(cell, {})
-                owner = unit_data.get('owner', '?')
-                card = unit_data.get('card', None)
-                moved = cell in game_env.moved_units  # Check if unit moved this turn
+                owner = unit_owner[cell]
+                moved = unit_moved[cell]  # Check if unit moved this turn
                 
                 if owner == 1:
                     color = 'blue'
@@ -279,21 +311,19 @@ class GameVisualizer:
                     self.ax.add_patch(plt.Circle((i, 0.5), 0.4, fill=False, color='black', linestyle='dashed'))
                 
                 # Add unit details
-                if card:
-                    # Show range as a semi-transparent circle
-                    range_circle = plt.Circle((i, 0.5), card.range, fill=True, 
-                                           color=color, alpha=0.1)
-                    self.ax.add_patch(range_circle)
-                    
-                    # Add unit stats
-                    self.ax.text(i, 0.5, f"{card.hp}", ha='center', va='center', 
-                               color='white', fontweight='bold')
-                    self.ax.text(i, 0.2, f"R{card.range}", ha='center', va='center',
-                               color='black', fontsize=8)
+                # Show range as a semi-transparent circle
+                range_circle = plt.Circle((i, 0.5), unit_range[cell], fill=True, 
+                                       color=color, alpha=0.1)
+                self.ax.add_patch(range_circle)
+                
+                # Add unit stats
+                self.ax.text(i, 0.5, f"{unit_hp[cell]}", ha='center', va='center', 
+                           color='white', fontweight='bold')
+                self.ax.text(i, 0.2, f"R{unit_range[cell]}", ha='center', va='center',
+                           color='black', fontsize=8)
         
         # Count units for each player
-        p1_units = sum(1 for unit in game_env.units.values() if unit['owner'] == 1)
-        p2_units = sum(1 for unit in game_env.units.values() if unit['owner'] == 2)
+        p1_units, p2_units = unit_counts if unit_counts is not None else self._count_units(game_env)
         
         # Add player info and decks
         # Player 1 info (left side)
@@ -426,7 +456,7 @@ def run_visualization(player1_type="ai", player2_type="ai", delay=2.0, turns=100
             temp_env._set_state(state)  # Set the state from replay
             viz.game_env = temp_env  # Update visualizer's game environment
             viz.visualize_state(temp_env, None, None)  # Pass None for players as we don't have them in replay
-            if i < len(states):  # Don't delay after the last state
+            if i < len(states) and delay > 0:  # Don't delay after the last state
                 time.sleep(delay)
         
         # Print final result
@@ -490,7 +520,8 @@ def run_visualization(player1_type="ai", player2_type="ai", delay=2.0, turns=100
                 break
             
             # Delay between turns
-            time.sleep(delay)
+            if delay > 0:
+                time.sleep(delay)
 
 
 def main():